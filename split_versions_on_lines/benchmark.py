@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import time
+from itertools import accumulate
+
+from data import CoMailFacility, Line, LineConfiguration
+from file import get_versions, load_from_file
+from split_versions_algorithm import (
+    AnytimeSearch,
+    SolutionChecker,
+    SplitVersionsGenerator,
+)
+
+DEFAULT_ROW_COUNTS = [1_000_000, 10_000_000, 100_000_000]
+DEFAULT_LINE_CONFIG_COUNTS = [2, 3, 4, 5, 6]
+
+
+def generate_input_file(
+    file_path,
+    number_of_rows,
+    seed=0,
+    delimiter=",",
+    number_of_versions=200,
+    version_size_exponent=1.0,
+    zip_size_shape=1.5,
+    rows_per_zip=25,
+):
+    """
+    Writes number_of_rows zip code/version rows. Version sizes follow a Zipf-like
+     distribution (weight 1 / rank ** version_size_exponent) and zip code sizes a
+     Pareto distribution with zip_size_shape, rows_per_zip rows per zip code on average.
+     The same arguments always give the same file.
+    """
+    random_generator = random.Random(seed)
+    number_of_zip_codes = max(number_of_rows // rows_per_zip, 1)
+    versions = [f"V{i:04d}" for i in range(number_of_versions)]
+    version_cum_weights = list(
+        accumulate(1 / (i + 1) ** version_size_exponent for i in range(len(versions)))
+    )
+    zip_cum_weights = list(
+        accumulate(
+            random_generator.paretovariate(zip_size_shape)
+            for _ in range(number_of_zip_codes)
+        )
+    )
+
+    with open(file_path, "w") as f:
+        rows_left = number_of_rows
+        while rows_left > 0:
+            batch_size = min(rows_left, 1_000_000)
+            zip_codes = random_generator.choices(
+                range(number_of_zip_codes), cum_weights=zip_cum_weights, k=batch_size
+            )
+            batch_versions = random_generator.choices(
+                versions, cum_weights=version_cum_weights, k=batch_size
+            )
+            f.write(
+                "".join(
+                    f"{zip_code:09d}{delimiter}{version}\n"
+                    for zip_code, version in zip(zip_codes, batch_versions)
+                )
+            )
+            rows_left -= batch_size
+
+
+def generate_co_mail_facility(versions, number_of_line_configs):
+    """
+    Facility with number_of_line_configs single-line configs, shaped like run(): all
+     pockets together fit every version with one split per line config, the
+     other lines share the pieces and the last one can take all of them.
+    """
+    number_of_pieces = sum([version.quantity for version in versions])
+    number_of_pockets = len(versions) + number_of_line_configs
+    line_configs = [
+        LineConfiguration(
+            pk=i + 1,
+            pockets=(number_of_pockets + i) // number_of_line_configs,
+            min_quantity_per_line=number_of_pieces // (20 * number_of_line_configs),
+            max_quantity_all_lines=(
+                3 * number_of_pieces // 2
+                if i == number_of_line_configs - 1
+                else 3 * number_of_pieces // (2 * number_of_line_configs)
+            ),
+        )
+        for i in range(number_of_line_configs)
+    ]
+    return CoMailFacility(
+        line_configs=line_configs,
+        lines=[Line(line_configuration=line_config) for line_config in line_configs],
+    )
+
+
+def benchmark_parsers(row_counts, directory="."):
+    for number_of_rows in row_counts:
+        file_path = get_input_file(number_of_rows, directory)
+
+        start = time.time()
+        line_result = load_from_file([file_path])
+        line_time = time.time() - start
+
+        start = time.time()
+        chunked_result = load_from_file([file_path], chunked=True)
+        chunked_time = time.time() - start
+
+        assert line_result == chunked_result
+        print(
+            f"{number_of_rows} rows | readline: {line_time:.2f}s"
+            f" | chunked: {chunked_time:.2f}s"
+            f" | speedup: {line_time / chunked_time:.2f}x"
+        )
+
+
+def benchmark_pipeline(
+    row_counts=DEFAULT_ROW_COUNTS,
+    line_config_counts=DEFAULT_LINE_CONFIG_COUNTS,
+    directory=".",
+    output_path="benchmark-results.jsonl",
+    number_of_solutions=100,
+    search_time_limit=60.0,
+):
+    """
+    Times loading, search and scoring separately for every row count and number of
+     line configs. One JSON object per case is appended to output_path. The search
+     is an AnytimeSearch for the first number_of_solutions solutions, stopped after
+     search_time_limit seconds, so bigger facilities finish too.
+    """
+    environment = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    for number_of_rows in row_counts:
+        file_path = get_input_file(number_of_rows, directory)
+
+        start = time.time()
+        versions, address_mapping = get_versions([file_path], compact=True)
+        load_seconds = time.time() - start
+
+        for number_of_line_configs in line_config_counts:
+            co_mail_facility = generate_co_mail_facility(
+                versions, number_of_line_configs
+            )
+
+            start = time.time()
+            generator = SplitVersionsGenerator(co_mail_facility, versions)
+            search = AnytimeSearch(generator, number_of_solutions)
+            solutions = search.run(time_limit=search_time_limit)
+            search_seconds = time.time() - start
+
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                number_of_packages, _ = SolutionChecker(
+                    solutions,
+                    address_mapping,
+                    generator.line_configs,
+                    use_package_count_engine=True,
+                ).calculate_solutions()
+            scoring_seconds = time.time() - start
+
+            result = {
+                "rows": number_of_rows,
+                "line_configs": number_of_line_configs,
+                "versions": len(versions),
+                "zip_codes": len(address_mapping),
+                "load_seconds": round(load_seconds, 4),
+                "search_seconds": round(search_seconds, 4),
+                "search_nodes": search.number_of_nodes,
+                "search_finished": search.is_finished,
+                "solutions": len(solutions),
+                "scoring_seconds": round(scoring_seconds, 4),
+                "best_number_of_packages": number_of_packages,
+                "timestamp": time.time(),
+                **environment,
+            }
+            with open(output_path, "a") as f:
+                f.write(json.dumps(result) + "\n")
+            print(json.dumps(result))
+
+
+def get_input_file(number_of_rows, directory="."):
+    file_path = os.path.join(directory, f"benchmark-{number_of_rows}.csv")
+    if not os.path.exists(file_path):
+        generate_input_file(file_path, number_of_rows)
+    return file_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rows", nargs="*", type=int)
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="time loading, search and scoring instead of the parsers",
+    )
+    parser.add_argument(
+        "--line-configs", nargs="*", type=int, default=DEFAULT_LINE_CONFIG_COUNTS
+    )
+    parser.add_argument("--directory", default=".")
+    parser.add_argument("--output", default="benchmark-results.jsonl")
+    parser.add_argument("--solutions", type=int, default=100)
+    parser.add_argument("--search-time-limit", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.pipeline:
+        benchmark_pipeline(
+            args.rows or DEFAULT_ROW_COUNTS,
+            args.line_configs,
+            directory=args.directory,
+            output_path=args.output,
+            number_of_solutions=args.solutions,
+            search_time_limit=args.search_time_limit,
+        )
+    else:
+        benchmark_parsers(args.rows or [10_000_000, 100_000_000], args.directory)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from compact_address_mapping import CompactAddressMapping
+from data import Version
+from file import load_compact_from_file
+
+CACHE_MAGIC = b"SVCACHE1"
+HEADER_FORMAT = "<8sq"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+def get_default_cache_path(file_names, cache_directory=None):
+    """
+    Cache file next to the first input file, or in cache_directory if it is given.
+    """
+    paths_hash = hashlib.sha1(
+        "\n".join(os.path.abspath(file_name) for file_name in file_names).encode()
+    ).hexdigest()
+    cache_path = f"{file_names[0]}.{paths_hash[:12]}.cache"
+    if cache_directory is not None:
+        cache_path = os.path.join(cache_directory, os.path.basename(cache_path))
+    return cache_path
+
+
+def get_source_signature(file_names, use_content_hash=False):
+    signature = []
+    for file_name in file_names:
+        stat = os.stat(file_name)
+        source = {"path": os.path.abspath(file_name), "size": stat.st_size}
+        if use_content_hash:
+            source["sha256"] = _get_content_hash(file_name)
+        else:
+            source["mtime_ns"] = stat.st_mtime_ns
+        signature.append(source)
+    return signature
+
+
+def _get_content_hash(file_name):
+    content_hash = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        while chunk := f.read(16 * 1024 * 1024):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def write_cache(cache_path, source_signature, version_id_mapping, d, address_mapping):
+    metadata = {
+        "byteorder": sys.byteorder,
+        "sources": source_signature,
+        "version_names": [version_id_mapping[i] for i in range(len(d))],
+        "quantities": [d[i] for i in range(len(d))],
+        "zip_codes": address_mapping.zip_codes,
+        "offsets_count": len(address_mapping.offsets),
+        "values_count": len(address_mapping.values),
+    }
+    metadata_bytes = json.dumps(metadata).encode()
+    # Keep the offsets buffer 8-byte aligned so it can be cast directly from the mmap.
+    metadata_bytes += b" " * (-(HEADER_SIZE + len(metadata_bytes)) % 8)
+
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, CACHE_MAGIC, len(metadata_bytes)))
+            f.write(metadata_bytes)
+            f.write(address_mapping.offsets.tobytes())
+            f.write(address_mapping.values.tobytes())
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_cache(cache_path, source_signature=None):
+    """
+    Returns (metadata, CompactAddressMapping) with offsets and values backed by a
+     memory-mapped cache file, or None if the cache is missing, stale or corrupt
+     (e.g. empty or cut off), so that it is rebuilt.
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with open(cache_path, "rb") as f:
+            magic, metadata_size = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+            if magic != CACHE_MAGIC:
+                return None
+            metadata = json.loads(f.read(metadata_size))
+            if metadata["byteorder"] != sys.byteorder:
+                return None
+            if source_signature is not None and metadata["sources"] != source_signature:
+                return None
+            offsets_start = HEADER_SIZE + metadata_size
+            values_start = offsets_start + 8 * metadata["offsets_count"]
+            values_end = values_start + 4 * metadata["values_count"]
+            if os.fstat(f.fileno()).st_size < values_end:
+                return None
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (struct.error, ValueError, KeyError, TypeError):
+        # ValueError covers JSONDecodeError and UnicodeDecodeError
+        return None
+
+    memory = memoryview(buffer)
+    address_mapping = CompactAddressMapping(
+        metadata["zip_codes"],
+        memory[offsets_start:values_start].cast("q"),
+        memory[values_start:values_end].cast("i"),
+    )
+    return metadata, address_mapping
+
+
+def get_versions_cached(
+    file_names,
+    cache_path=None,
+    use_content_hash=False,
+    compact=True,
+    cache_directory=None,
+):
+    """
+    Same result as get_versions(file_names, compact=compact), but the parsed input is
+     stored in a binary cache file and reused until any source file changes. If the
+     cache file cannot be written (e.g. in a read-only directory), the input is
+     loaded without it.
+    """
+    cache_path = cache_path or get_default_cache_path(file_names, cache_directory)
+    source_signature = get_source_signature(file_names, use_content_hash)
+
+    cached = read_cache(cache_path, source_signature)
+    if cached is None:
+        address_size, version_id_mapping, d, address_mapping = load_compact_from_file(
+            file_names
+        )
+        quantities = [d[i] for i in range(len(d))]
+        try:
+            write_cache(
+                cache_path, source_signature, version_id_mapping, d, address_mapping
+            )
+        except OSError:
+            pass
+        else:
+            cached = read_cache(cache_path)
+    if cached is not None:
+        metadata, address_mapping = cached
+        quantities = metadata["quantities"]
+
+    versions = [
+        Version(version_id=version_id, quantity=quantity)
+        for version_id, quantity in enumerate(quantities)
+    ]
+    if not compact:
+        return versions, address_mapping.to_dict()
+    return versions, address_mapping
@@ -0,0 +1,80 @@
+from array import array
+
+
+class CompactAddressMapping:
+    """
+    Zip code -> version ids relation kept in flat integer buffers (CSR layout).
+     Versions of the zip code with index i are values[offsets[i]:offsets[i + 1]],
+     in the same order as in the input files.
+    """
+
+    __slots__ = ("zip_codes", "offsets", "values")
+
+    def __init__(self, zip_codes: list[str], offsets: array, values: array):
+        self.zip_codes = zip_codes
+        self.offsets = offsets
+        self.values = values
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    def __iter__(self):
+        return iter(self.zip_codes)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactAddressMapping):
+            return NotImplemented
+        return (
+            self.zip_codes == other.zip_codes
+            and memoryview(self.offsets) == memoryview(other.offsets)
+            and memoryview(self.values) == memoryview(other.values)
+        )
+
+    def versions_at(self, zip_index: int) -> array:
+        return self.values[self.offsets[zip_index] : self.offsets[zip_index + 1]]
+
+    def items(self):
+        offsets = self.offsets
+        values = self.values
+        for zip_index, zip_code in enumerate(self.zip_codes):
+            yield zip_code, values[offsets[zip_index] : offsets[zip_index + 1]]
+
+    def to_dict(self) -> dict[str, list[int]]:
+        return {zip_code: versions.tolist() for zip_code, versions in self.items()}
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.offsets.itemsize * len(self.offsets)
+            + self.values.itemsize * len(self.values)
+        )
+
+    @classmethod
+    def from_address_mapping(cls, address_mapping: dict[str, list[int]]):
+        zip_codes = []
+        offsets = array("q", [0])
+        values = array("i")
+        for zip_code, versions in address_mapping.items():
+            zip_codes.append(zip_code)
+            values.extend(versions)
+            offsets.append(len(values))
+        return cls(zip_codes, offsets, values)
+
+    @classmethod
+    def from_rows(cls, zip_codes: list[str], zip_ids: array, version_ids: array):
+        """
+        Builds the mapping from per-row zip ids and version ids with a stable counting
+         sort, so the order of versions inside every zip code is kept.
+        """
+        offsets = array("q", bytes(8 * (len(zip_codes) + 1)))
+        for zip_id in zip_ids:
+            offsets[zip_id + 1] += 1
+        for zip_index in range(len(zip_codes)):
+            offsets[zip_index + 1] += offsets[zip_index]
+
+        positions = offsets[:-1]
+        values = array("i", bytes(4 * len(version_ids)))
+        for zip_id, version_id in zip(zip_ids, version_ids):
+            values[positions[zip_id]] = version_id
+            positions[zip_id] += 1
+        return cls(zip_codes, offsets, values)
@@ -1,5 +1,13 @@
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from compact_address_mapping import CompactAddressMapping
 from data import Version
 
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
 
 def sort_by_occurrence(d):
     result_xx = sorted(d.items(), key=lambda x: x[1])
@@ -29,13 +37,128 @@ def get_and_merge_from_file(d, address_mapping, file_path):
     return address_size
 
 
-def load_from_file(files):
+def detect_delimiter(line):
+    return "," if "," in line else "|"
+
+
+def _split_block(block, delimiter):
+    block = block.strip()
+    if not block:
+        return [], []
+    if "\n\n" not in block and " " not in block and "\t" not in block:
+        # Fast path: turning the delimiter into a line break gives a flat list of
+        #   alternating zip codes and versions, so both columns are plain slices.
+        #   Malformed rows go to the slow path, which raises on them.
+        if set(map(str.count, block.split("\n"), repeat(delimiter))) == {1}:
+            fields = block.replace(delimiter, "\n").split("\n")
+            return fields[0::2], fields[1::2]
+    rows = [line.strip().split(delimiter) for line in block.split("\n")]
+    zip_codes = []
+    version_pks = []
+    for row in rows:
+        if row == [""]:
+            continue
+        # Raises ValueError on malformed rows, like get_and_merge_from_file
+        zip_code, version_pk = row
+        zip_codes.append(zip_code)
+        version_pks.append(version_pk)
+    return zip_codes, version_pks
+
+
+def merge_block(d, address_mapping, zip_codes, version_pks):
+    for version_pk, count in Counter(version_pks).items():
+        d[version_pk] = d.get(version_pk, 0) + count
+
+    address_mapping_get = address_mapping.get
+    for zip_code, version_pk in zip(zip_codes, version_pks):
+        zip_versions = address_mapping_get(zip_code)
+        if zip_versions is None:
+            address_mapping[zip_code] = [version_pk]
+        else:
+            zip_versions.append(version_pk)
+    return len(version_pks)
+
+
+def read_blocks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads the file in big blocks and yields (zip_codes, version_pks) column lists for
+     every block. Delimiter is detected once, from the first line.
+    """
+    with open(file_path, "r") as f:
+        delimiter = None
+        rest = ""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            block = rest + chunk
+            last_line_end = block.rfind("\n")
+            if last_line_end == -1:
+                rest = block
+                continue
+            rest = block[last_line_end + 1 :]
+            block = block[:last_line_end]
+
+            if delimiter is None:
+                delimiter = detect_delimiter(block.lstrip().split("\n", 1)[0])
+            yield _split_block(block, delimiter)
+
+        if rest.strip():
+            if delimiter is None:
+                delimiter = detect_delimiter(rest)
+            yield _split_block(rest, delimiter)
+
+
+def get_and_merge_from_file_chunked(
+    d, address_mapping, file_path, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    address_size = 0
+    for zip_codes, version_pks in read_blocks(file_path, chunk_size):
+        address_size += merge_block(d, address_mapping, zip_codes, version_pks)
+    return address_size
+
+
+def _load_shard(file_name, chunked):
+    d = {}
+    address_mapping = {}
+    merge_from_file = (
+        get_and_merge_from_file_chunked if chunked else get_and_merge_from_file
+    )
+    address_size = merge_from_file(d, address_mapping, file_name)
+    return address_size, d, address_mapping
+
+
+def merge_shards(d, address_mapping, shard_d, shard_address_mapping):
+    """
+    Merging shards in file order gives the same version order and the same order of
+     versions inside every zip code as loading the files one after another.
+    """
+    for version, count in shard_d.items():
+        d[version] = d.get(version, 0) + count
+    for zip_code, versions in shard_address_mapping.items():
+        if zip_code in address_mapping:
+            address_mapping[zip_code].extend(versions)
+        else:
+            address_mapping[zip_code] = versions
+
+
+def load_from_file(files, chunked=False, parallel=False, max_workers=None):
     d = {}
     address_mapping = {}
     address_size = 0
-    for file_name in files:
-        new_address_size = get_and_merge_from_file(d, address_mapping, file_name)
-        address_size += new_address_size
+    if parallel:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            shards = executor.map(_load_shard, files, [chunked] * len(files))
+            for shard_address_size, shard_d, shard_address_mapping in shards:
+                merge_shards(d, address_mapping, shard_d, shard_address_mapping)
+                address_size += shard_address_size
+    else:
+        merge_from_file = (
+            get_and_merge_from_file_chunked if chunked else get_and_merge_from_file
+        )
+        for file_name in files:
+            new_address_size = merge_from_file(d, address_mapping, file_name)
+            address_size += new_address_size
     new_d = {}
     for version, count in d.items():
         new_d[version] = count
@@ -67,11 +190,54 @@ def get_version_id_mapping(d, address_mapping):
     return version_id_mapping, new_d, new_address_mapping
 
 
-def get_versions(file_names):
-    address_size_x, d_x, address_mapping = load_from_file(file_names)
-    version_id_to_name_mapping, d_x, address_mapping = get_version_id_mapping(
-        d_x, address_mapping
+def load_compact_from_file(files, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Loads files straight into CompactAddressMapping. Zip codes and versions are interned
+     to dense ids in order of first occurrence, so version ids are the same as from
+     get_version_id_mapping.
+    """
+    zip_code_ids = {}
+    version_ids_by_name = {}
+    zip_ids = array("i")
+    version_ids = array("i")
+    for file_name in files:
+        for zip_codes, version_pks in read_blocks(file_name, chunk_size):
+            intern_zip_code = zip_code_ids.setdefault
+            intern_version = version_ids_by_name.setdefault
+            zip_ids.extend(
+                [intern_zip_code(zip_code, len(zip_code_ids)) for zip_code in zip_codes]
+            )
+            version_ids.extend(
+                [
+                    intern_version(version_pk, len(version_ids_by_name))
+                    for version_pk in version_pks
+                ]
+            )
+
+    d = dict.fromkeys(range(len(version_ids_by_name)), 0)
+    for version_id, count in Counter(version_ids).items():
+        d[version_id] = count
+    version_id_mapping = {
+        version_id: version for version, version_id in version_ids_by_name.items()
+    }
+    address_mapping = CompactAddressMapping.from_rows(
+        list(zip_code_ids), zip_ids, version_ids
     )
+    return len(version_ids), version_id_mapping, d, address_mapping
+
+
+def get_versions(file_names, chunked=False, compact=False, parallel=False):
+    if compact:
+        address_size_x, version_id_to_name_mapping, d_x, address_mapping = (
+            load_compact_from_file(file_names)
+        )
+    else:
+        address_size_x, d_x, address_mapping = load_from_file(
+            file_names, chunked=chunked, parallel=parallel
+        )
+        version_id_to_name_mapping, d_x, address_mapping = get_version_id_mapping(
+            d_x, address_mapping
+        )
     versions = []
     for key, value in d_x.items():
         versions.append(Version(version_id=key, quantity=value))
@@ -0,0 +1,714 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from dataclasses import dataclass, field
+
+from data import CoMailFacility, Version
+from file import detect_delimiter, load_compact_from_file
+from scoring import PACKAGE_SIZE, PackageCountEngine
+from solutions import SplitVersionsSolution
+from split_versions_algorithm import SplitVersionsGenerator
+
+# Zip codes per block when looking for the next zip code a budget change reaches
+SCAN_BLOCK_SIZE = 256
+
+
+def read_delta_file(file_path) -> Counter:
+    """
+    Reads a delta file into (zip code, version pk) -> change of the number of pieces.
+     Rows are "zip_code,version_pk" like in input files (one added piece) or
+     "zip_code,version_pk,change" with a signed change, e.g. -1 for a removed piece.
+    """
+    delta = Counter()
+    with open(file_path, "r") as f:
+        delimiter = None
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if delimiter is None:
+                delimiter = detect_delimiter(line)
+            zip_code, version_pk, *change = line.split(delimiter)
+            delta[(zip_code, version_pk)] += int(change[0]) if change else 1
+    return delta
+
+
+class ZipContents:
+    """
+    Zip code -> {version id: number of pieces}, read from a PackageCountEngine built
+     once from the full input, with zip codes changed by deltas kept as overrides.
+     New zip codes go after all existing ones, as they would in a full load.
+    """
+
+    def __init__(self, engine: PackageCountEngine):
+        self.engine = engine
+        self.zip_codes = list(engine.zip_codes)
+        self.zip_indexes = {zip_code: i for i, zip_code in enumerate(self.zip_codes)}
+        self.overrides: dict[int, dict[int, int]] = {}
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    def get(self, zip_index: int) -> dict[int, int]:
+        if zip_index in self.overrides:
+            return self.overrides[zip_index]
+        engine = self.engine
+        start, end = engine.offsets[zip_index], engine.offsets[zip_index + 1]
+        return dict(
+            zip(engine.entry_versions[start:end], engine.entry_counts[start:end])
+        )
+
+    def get_count(self, zip_code: str, version_id: int | None) -> int:
+        zip_index = self.zip_indexes.get(zip_code)
+        if zip_index is None or version_id is None:
+            return 0
+        return self.get(zip_index).get(version_id, 0)
+
+    def items(self):
+        for zip_index, zip_code in enumerate(self.zip_codes):
+            yield zip_code, self.get(zip_index)
+
+    def apply(self, zip_code: str, version_id: int, change: int) -> int:
+        """
+        Changes the number of pieces of the version in the zip code and returns the
+         zip code index.
+        """
+        zip_index = self.zip_indexes.get(zip_code)
+        if zip_index is None:
+            zip_index = len(self.zip_codes)
+            self.zip_codes.append(zip_code)
+            self.zip_indexes[zip_code] = zip_index
+            self.overrides[zip_index] = {}
+        elif zip_index not in self.overrides:
+            self.overrides[zip_index] = self.get(zip_index)
+
+        content = self.overrides[zip_index]
+        count = content.get(version_id, 0) + change
+        if count < 0:
+            raise ValueError(
+                f"Delta removes more pieces of version {version_id} than {zip_code} has"
+            )
+        content[version_id] = count
+        return zip_index
+
+
+class IncrementalPackageCount:
+    """
+    Number of packages of one solution, the same as PackageCountEngine gives, which
+     can be updated when a delta changes a few zip codes.
+
+    Zip codes are packed one by one through all lines (scoring order), which gives
+     the same result as full line passes. Budgets of versions assigned to a single
+     line always cover every piece left, so only versions split between lines can run
+     out of budget, and zip codes depend on each other only through them. For every
+     split version the pieces taken in every zip code holding it are kept. An update
+     repacks touched zip codes and, while a split version's budget differs from the
+     kept run, the next zip codes holding that version where the budget left decides
+     how many pieces are taken.
+    """
+
+    def __init__(
+        self,
+        zip_contents: ZipContents,
+        line_versions_tuple_list: list,
+        package_size: int = PACKAGE_SIZE,
+    ):
+        self.zip_contents = zip_contents
+        self.package_size = package_size
+        self.lines = self._get_line_budgets(line_versions_tuple_list)
+        self.split_versions = self._get_split_versions(self.lines)
+        self._score_all()
+
+    @staticmethod
+    def _get_line_budgets(line_versions_tuple_list) -> list[dict[int, int]]:
+        # Reversed because we want to calculate it from the biggest pocket's line
+        return [
+            {
+                version_id: count
+                for version_id, count in {vt[0]: vt[1] for vt in line}.items()
+                if count > 0
+            }
+            for line_config_solution in reversed(line_versions_tuple_list)
+            for line in line_config_solution
+        ]
+
+    @staticmethod
+    def _get_split_versions(lines) -> list[list[int]]:
+        number_of_lines = Counter(
+            version_id for budgets in lines for version_id in budgets
+        )
+        return [
+            [version_id for version_id in budgets if number_of_lines[version_id] > 1]
+            for budgets in lines
+        ]
+
+    def has_same_lines(self, line_versions_tuple_list) -> bool:
+        lines = self._get_line_budgets(line_versions_tuple_list)
+        return [budgets.keys() for budgets in lines] == [
+            budgets.keys() for budgets in self.lines
+        ]
+
+    def _score_all(self):
+        """
+        Packs every zip code and keeps, per line, which zip codes made a package and,
+         per line and split version, the pieces taken in every zip code holding it.
+        """
+        number_of_zips = len(self.zip_contents)
+        self.packed = [bytearray(number_of_zips) for _ in self.lines]
+        split_version_ids = {v for versions in self.split_versions for v in versions}
+        self.version_zips = {
+            version_id: array("i") for version_id in split_version_ids
+        }
+        self.version_counts = {
+            version_id: array("i") for version_id in split_version_ids
+        }
+        self.taken = {
+            (line_index, version_id): array("i")
+            for line_index, versions in enumerate(self.split_versions)
+            for version_id in versions
+        }
+
+        pieces_left = [
+            {version_id: budgets[version_id] for version_id in versions}
+            for budgets, versions in zip(self.lines, self.split_versions)
+        ]
+        self.number_of_packages = 0
+        for zip_index in range(number_of_zips):
+            content = self.zip_contents.get(zip_index)
+            for version_id in split_version_ids.intersection(content):
+                if content[version_id] > 0:
+                    self.version_zips[version_id].append(zip_index)
+                    self.version_counts[version_id].append(content[version_id])
+            for line_index, (packed, line_taken) in enumerate(
+                self._pack_zip(content, pieces_left)
+            ):
+                for version_id in self.split_versions[line_index]:
+                    taken = line_taken.get(version_id, 0)
+                    if content.get(version_id, 0) > 0:
+                        self.taken[(line_index, version_id)].append(taken)
+                    if packed:
+                        pieces_left[line_index][version_id] -= taken
+                if packed:
+                    self.packed[line_index][zip_index] = 1
+                    self.number_of_packages += 1
+
+    def _pack_zip(self, content: dict[int, int], split_pieces_left: list[dict]):
+        """
+        Yields (made a package, {split version id: pieces taken}) for every line, with
+         split_pieces_left holding the budgets of split versions left at this zip code.
+        """
+        content = dict(content)
+        for budgets, line_pieces_left in zip(self.lines, split_pieces_left):
+            pieces_count = 0
+            taken = {}
+            for version_id, count in content.items():
+                if not count or version_id not in budgets:
+                    continue
+                pieces_left = line_pieces_left.get(version_id, count)
+                if pieces_left > 0:
+                    pieces = count if count < pieces_left else pieces_left
+                    content[version_id] = count - pieces
+                    pieces_count += pieces
+                    if version_id in line_pieces_left:
+                        taken[version_id] = pieces
+            yield pieces_count >= self.package_size, taken
+
+    def update(self, line_versions_tuple_list, touched_zip_indexes) -> int:
+        """
+        Updates the number of packages after zip_contents changed in
+         touched_zip_indexes and budgets changed to line_versions_tuple_list (with the
+         same versions on every line). Returns the number of repacked zip codes.
+        """
+        new_lines = self._get_line_budgets(line_versions_tuple_list)
+        number_of_zips = len(self.zip_contents)
+        for packed in self.packed:
+            packed.extend(bytes(number_of_zips - len(packed)))
+
+        # Split versions which are new in touched zip codes are added to the kept run
+        #   with nothing taken, so the old budgets left stay right.
+        for zip_index in touched_zip_indexes:
+            content = self.zip_contents.get(zip_index)
+            for version_id, version_zips in self.version_zips.items():
+                count = content.get(version_id, 0)
+                position = bisect_left(version_zips, zip_index)
+                if position < len(version_zips) and version_zips[position] == zip_index:
+                    self.version_counts[version_id][position] = count
+                    continue
+                if count <= 0:
+                    continue
+                version_zips.insert(position, zip_index)
+                self.version_counts[version_id].insert(position, count)
+                for line_index, versions in enumerate(self.split_versions):
+                    if version_id in versions:
+                        self.taken[(line_index, version_id)].insert(position, 0)
+
+        # Pieces consumed before every kept zip code in the kept run, and the budget
+        #   left there minus the pieces of the zip code (slack), with its minimum per
+        #   block of zip codes
+        consumed_before = {}
+        slacks = {}
+        block_min_slacks = {}
+        for (line_index, version_id), taken in self.taken.items():
+            packed = self.packed[line_index]
+            budget = self.lines[line_index][version_id]
+            consumed = array("q", [0])
+            slack = array("q")
+            total = 0
+            for zip_index, pieces, count in zip(
+                self.version_zips[version_id],
+                taken,
+                self.version_counts[version_id],
+            ):
+                slack.append(budget - total - count)
+                if packed[zip_index]:
+                    total += pieces
+                consumed.append(total)
+            consumed_before[(line_index, version_id)] = consumed
+            slacks[(line_index, version_id)] = slack
+            block_min_slacks[(line_index, version_id)] = [
+                min(slack[i : i + SCAN_BLOCK_SIZE])
+                for i in range(0, len(slack), SCAN_BLOCK_SIZE)
+            ]
+
+        # Difference between the new and the kept budget left of every split version
+        budget_differences = {
+            (line_index, version_id): new_lines[line_index][version_id]
+            - self.lines[line_index][version_id]
+            for line_index, versions in enumerate(self.split_versions)
+            for version_id in versions
+        }
+
+        zips_to_pack = list(set(touched_zip_indexes))
+        heapq.heapify(zips_to_pack)
+        scanned_positions = dict.fromkeys(budget_differences, 0)
+
+        def push_next_zip(key, position):
+            """
+            Pushes the first zip code from position on where the version's new budget
+             left can take a different number of pieces than the kept one. Before it
+             both are enough for all pieces, or both are used up.
+            """
+            difference = budget_differences[key]
+            if not difference:
+                return
+            line_index, version_id = key
+            slack = slacks[key]
+            block_min_slack = block_min_slacks[key]
+            # Both budgets left are used up from end on, and both are enough where the
+            #   slack is at least min_slack
+            end = bisect_left(
+                consumed_before[key],
+                self.lines[line_index][version_id] + max(difference, 0),
+            )
+            end = min(end, len(slack))
+            min_slack = max(-difference, 0)
+            position = max(position, scanned_positions[key])
+            while position < end:
+                if (
+                    position % SCAN_BLOCK_SIZE == 0
+                    and block_min_slack[position // SCAN_BLOCK_SIZE] >= min_slack
+                ):
+                    position += SCAN_BLOCK_SIZE
+                elif slack[position] < min_slack:
+                    heapq.heappush(
+                        zips_to_pack, self.version_zips[version_id][position]
+                    )
+                    break
+                else:
+                    position += 1
+            scanned_positions[key] = position
+
+        for key in budget_differences:
+            push_next_zip(key, 0)
+
+        number_of_repacked_zips = 0
+        last_zip_index = -1
+        while zips_to_pack:
+            zip_index = heapq.heappop(zips_to_pack)
+            if zip_index == last_zip_index:
+                continue
+            last_zip_index = zip_index
+            number_of_repacked_zips += 1
+
+            positions = {}
+            split_pieces_left = []
+            for line_index, versions in enumerate(self.split_versions):
+                line_pieces_left = {}
+                for version_id in versions:
+                    version_zips = self.version_zips[version_id]
+                    position = bisect_left(version_zips, zip_index)
+                    positions[version_id] = position
+                    line_pieces_left[version_id] = (
+                        self.lines[line_index][version_id]
+                        - consumed_before[(line_index, version_id)][position]
+                        + budget_differences[(line_index, version_id)]
+                    )
+                split_pieces_left.append(line_pieces_left)
+
+            content = self.zip_contents.get(zip_index)
+            for line_index, (packed, line_taken) in enumerate(
+                self._pack_zip(content, split_pieces_left)
+            ):
+                was_packed = self.packed[line_index][zip_index]
+                self.number_of_packages += packed - was_packed
+                self.packed[line_index][zip_index] = packed
+                for version_id in self.split_versions[line_index]:
+                    version_zips = self.version_zips[version_id]
+                    position = positions[version_id]
+                    if (
+                        position == len(version_zips)
+                        or version_zips[position] != zip_index
+                    ):
+                        continue
+                    taken = self.taken[(line_index, version_id)]
+                    old_consumed = taken[position] if was_packed else 0
+                    new_consumed = line_taken.get(version_id, 0) if packed else 0
+                    taken[position] = line_taken.get(version_id, 0)
+                    if old_consumed != new_consumed:
+                        budget_differences[(line_index, version_id)] += (
+                            old_consumed - new_consumed
+                        )
+                        scanned_positions[(line_index, version_id)] = 0
+
+            for key in budget_differences:
+                push_next_zip(key, bisect_right(self.version_zips[key[1]], zip_index))
+
+        self.lines = new_lines
+        return number_of_repacked_zips
+
+
+@dataclass
+class DeltaReport:
+    # Version id -> change of its quantity, only for versions which changed
+    changed_versions: dict[int, int] = field(default_factory=dict)
+    touched_zip_codes: list[str] = field(default_factory=list)
+    researched: bool = False
+    number_of_repacked_zips: int = 0
+    best_number_of_packages: int = 0
+
+
+class IncrementalPlanner:
+    """
+    Keeps the search results and their numbers of packages up to date when delta
+     files with added and removed pieces arrive, without loading the input again.
+     Solutions are patched with the quantity changes and the search runs again only
+     if a patched solution breaks line limits or a new version shows up. Otherwise
+     only zip codes touched by the delta (and the ones depending on them through
+     split versions) are repacked.
+
+    Like generate(number_of_solutions), the first number_of_solutions solutions are
+     kept (all of them for None).
+    """
+
+    def __init__(
+        self,
+        co_mail_facility: CoMailFacility,
+        versions: list[Version],
+        version_names: list[str],
+        address_mapping,
+        number_of_solutions: int | None = 5,
+        package_size: int = PACKAGE_SIZE,
+    ):
+        self.co_mail_facility = co_mail_facility
+        self.version_quantities = {
+            version.version_id: version.quantity for version in versions
+        }
+        self.version_names = list(version_names)
+        self.version_ids_by_name = {
+            name: version_id for version_id, name in enumerate(self.version_names)
+        }
+        self.number_of_solutions = number_of_solutions
+        self.package_size = package_size
+        self.zip_contents = ZipContents(
+            PackageCountEngine(address_mapping, package_size)
+        )
+        self.generator: SplitVersionsGenerator | None = None
+        self.solutions: list[SplitVersionsSolution] = []
+        self.package_counts: list[IncrementalPackageCount] = []
+        self.plan()
+
+    @classmethod
+    def from_files(cls, co_mail_facility: CoMailFacility, file_names, **kwargs):
+        _, version_id_mapping, d, address_mapping = load_compact_from_file(file_names)
+        versions = [
+            Version(version_id=version_id, quantity=quantity)
+            for version_id, quantity in d.items()
+        ]
+        version_names = [version_id_mapping[i] for i in range(len(d))]
+        return cls(co_mail_facility, versions, version_names, address_mapping, **kwargs)
+
+    def plan(self):
+        self.generator = self._get_generator()
+        self.solutions = self.generator.generate(self.number_of_solutions)
+        self.package_counts = [
+            IncrementalPackageCount(
+                self.zip_contents, solution.line_versions_tuple_list, self.package_size
+            )
+            for solution in self.solutions
+        ]
+
+    def _get_generator(self) -> SplitVersionsGenerator:
+        return SplitVersionsGenerator(
+            self.co_mail_facility,
+            [
+                Version(version_id=version_id, quantity=quantity)
+                for version_id, quantity in self.version_quantities.items()
+                if quantity > 0
+            ],
+        )
+
+    @property
+    def numbers_of_packages(self) -> list[int]:
+        return [
+            package_count.number_of_packages for package_count in self.package_counts
+        ]
+
+    def get_best_solution(self) -> tuple[int, SplitVersionsSolution | None]:
+        best_number_of_packages, best_solution = 0, None
+        for solution, number_of_packages in zip(
+            self.solutions, self.numbers_of_packages
+        ):
+            if number_of_packages > best_number_of_packages:
+                best_number_of_packages, best_solution = number_of_packages, solution
+        return best_number_of_packages, best_solution
+
+    def apply_delta_file(self, file_path) -> DeltaReport:
+        return self.apply_delta(read_delta_file(file_path))
+
+    def apply_delta(self, delta: Counter) -> DeltaReport:
+        """
+        Applies the delta and updates solutions and their numbers of packages. A delta
+         removing more pieces than a zip code has raises ValueError before anything
+         is changed.
+        """
+        for (zip_code, version_pk), change in delta.items():
+            if change < 0 and (
+                self.zip_contents.get_count(
+                    zip_code, self.version_ids_by_name.get(version_pk)
+                )
+                + change
+                < 0
+            ):
+                raise ValueError(
+                    f"Delta removes more pieces of version {version_pk} than "
+                    f"{zip_code} has"
+                )
+
+        report = DeltaReport()
+        touched_zip_indexes = set()
+        for (zip_code, version_pk), change in delta.items():
+            if not change:
+                continue
+            version_id = self.version_ids_by_name.get(version_pk)
+            if version_id is None:
+                version_id = len(self.version_names)
+                self.version_names.append(version_pk)
+                self.version_ids_by_name[version_pk] = version_id
+                self.version_quantities[version_id] = 0
+            touched_zip_indexes.add(
+                self.zip_contents.apply(zip_code, version_id, change)
+            )
+            self.version_quantities[version_id] += change
+            report.changed_versions[version_id] = (
+                report.changed_versions.get(version_id, 0) + change
+            )
+        report.changed_versions = {
+            version_id: change
+            for version_id, change in report.changed_versions.items()
+            if change
+        }
+        report.touched_zip_codes = [
+            self.zip_contents.zip_codes[zip_index]
+            for zip_index in sorted(touched_zip_indexes)
+        ]
+
+        self.generator = self._get_generator()
+        patched_solutions = [
+            self.patch_solution(solution, report.changed_versions)
+            for solution in self.solutions
+        ]
+        if not all(
+            solution is not None and self.generator.is_solution_valid(solution)
+            for solution in patched_solutions
+        ):
+            report.researched = True
+            self.plan()
+        else:
+            self.solutions = patched_solutions
+            for i, (solution, package_count) in enumerate(
+                zip(self.solutions, self.package_counts)
+            ):
+                if package_count.has_same_lines(solution.line_versions_tuple_list):
+                    report.number_of_repacked_zips += package_count.update(
+                        solution.line_versions_tuple_list, touched_zip_indexes
+                    )
+                else:
+                    self.package_counts[i] = IncrementalPackageCount(
+                        self.zip_contents,
+                        solution.line_versions_tuple_list,
+                        self.package_size,
+                    )
+
+        report.best_number_of_packages, _ = self.get_best_solution()
+        return report
+
+    @staticmethod
+    def _add_pieces(line: list, position: int, pieces: int) -> int:
+        version_id, count = line[position]
+        line[position] = (version_id, count + pieces)
+        return pieces
+
+    def _move_split_pieces(self, line_versions_tuple_list: list):
+        """
+        Moves pieces of versions split between lines out of line configs above
+         max_quantity_all_lines and into lines below min_quantity_per_line, as long as
+         the other line stays within its limits.
+        """
+        line_configs = self.generator.line_configs
+        lines = [
+            (line_config_index, line)
+            for line_config_index, line_config_solution in enumerate(
+                line_versions_tuple_list
+            )
+            for line in line_config_solution
+        ]
+
+        def get_limits(line_config_index, line):
+            # (pieces above max_quantity_all_lines, pieces above min_quantity_per_line)
+            line_config = line_configs[line_config_index]
+            line_config_quantity = sum(
+                count
+                for other_line in line_versions_tuple_list[line_config_index]
+                for _, count in other_line
+            )
+            return (
+                line_config_quantity - line_config.max_quantity_all_lines,
+                sum(count for _, count in line) - line_config.min_quantity_per_line,
+            )
+
+        for line_config_index, line in lines:
+            for position, (version_id, _) in enumerate(line):
+                for other_line_config_index, other_line in lines:
+                    above_max, above_min = get_limits(line_config_index, line)
+                    if above_max <= 0 and above_min >= 0:
+                        break
+                    other_position = next(
+                        (
+                            i
+                            for i, (other_version_id, _) in enumerate(other_line)
+                            if other_version_id == version_id
+                        ),
+                        None,
+                    )
+                    if other_line is line or other_position is None:
+                        continue
+                    same_line_config = other_line_config_index == line_config_index
+                    other_above_max, other_above_min = get_limits(
+                        other_line_config_index, other_line
+                    )
+                    if above_max > 0 and not same_line_config:
+                        # Out of this line config, into the other line
+                        pieces = max(
+                            min(
+                                above_max,
+                                line[position][1],
+                                above_min,
+                                -other_above_max,
+                            ),
+                            0,
+                        )
+                    elif above_min < 0:
+                        # Into this line, out of the other line
+                        pieces = -max(
+                            min(
+                                -above_min,
+                                other_line[other_position][1],
+                                other_above_min,
+                                -above_min if same_line_config else -above_max,
+                            ),
+                            0,
+                        )
+                    else:
+                        continue
+                    self._add_pieces(line, position, -pieces)
+                    self._add_pieces(other_line, other_position, pieces)
+
+    def patch_solution(
+        self, solution: SplitVersionsSolution, changed_versions: dict[int, int]
+    ) -> SplitVersionsSolution | None:
+        """
+        Moves quantity changes into the solution. Added pieces go first to lines whose
+         line config is furthest below max_quantity_all_lines, removed ones are taken
+         first from lines furthest above min_quantity_per_line, so the solution stays
+         within line limits whenever the lines holding the version allow it. If a
+         line config still breaks its limits, pieces of split versions are moved to or
+         from their other lines. Versions left without pieces free their pockets.
+         Returns None if a changed version has no line in the solution.
+        """
+        line_configs = self.generator.line_configs
+        line_versions_tuple_list = [
+            [list(line) for line in line_config_solution]
+            for line_config_solution in solution.line_versions_tuple_list
+        ]
+        for version_id, change in changed_versions.items():
+            positions = [
+                (line_config_index, line, position)
+                for line_config_index, line_config_solution in enumerate(
+                    line_versions_tuple_list
+                )
+                for line in line_config_solution
+                for position, (line_version_id, _) in enumerate(line)
+                if line_version_id == version_id
+            ]
+            if not positions:
+                return None
+
+            if change > 0:
+                # Room left below max_quantity_all_lines, the most first
+                rooms = [
+                    line_configs[line_config_index].max_quantity_all_lines
+                    - sum(
+                        count
+                        for line in line_versions_tuple_list[line_config_index]
+                        for _, count in line
+                    )
+                    for line_config_index, _, _ in positions
+                ]
+            else:
+                # Pieces above min_quantity_per_line, the most first
+                rooms = [
+                    min(
+                        sum(count for _, count in line)
+                        - line_configs[line_config_index].min_quantity_per_line,
+                        line[position][1],
+                    )
+                    for line_config_index, line, position in positions
+                ]
+            order = sorted(range(len(positions)), key=lambda i: -rooms[i])
+            for i in order:
+                pieces = min(abs(change), max(rooms[i], 0))
+                _, line, position = positions[i]
+                change -= self._add_pieces(
+                    line, position, pieces if change > 0 else -pieces
+                )
+
+            # Changes which do not fit in the rooms break line limits, so the search
+            #   runs again
+            for i in order:
+                _, line, position = positions[i]
+                pieces = change if change > 0 else -min(-change, line[position][1])
+                change -= self._add_pieces(line, position, pieces)
+            if change:
+                return None
+
+        self._move_split_pieces(line_versions_tuple_list)
+        return SplitVersionsSolution(
+            line_versions_tuple_list=[
+                [
+                    [version_tuple for version_tuple in line if version_tuple[1] > 0]
+                    for line in line_config_solution
+                ]
+                for line_config_solution in line_versions_tuple_list
+            ]
+        )
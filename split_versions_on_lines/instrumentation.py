@@ -0,0 +1,64 @@
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class PruneReason:
+    TOO_MANY_VERSIONS_FOR_NEXT_LINES = "TOO_MANY_VERSIONS_FOR_NEXT_LINES"
+    EMPTY_SPLIT = "EMPTY_SPLIT"
+    INVALID_LINE_CONFIG = "INVALID_LINE_CONFIG"
+    LINES_BELOW_MIN_QUANTITY = "LINES_BELOW_MIN_QUANTITY"
+    UPPER_BOUND = "UPPER_BOUND"
+
+
+class RejectionReason:
+    DUPLICATE = "DUPLICATE"
+    TOO_MANY_VERSIONS_ON_LINE = "TOO_MANY_VERSIONS_ON_LINE"
+    LINE_BELOW_MIN_QUANTITY = "LINE_BELOW_MIN_QUANTITY"
+    LINE_CONFIG_ABOVE_MAX_QUANTITY = "LINE_CONFIG_ABOVE_MAX_QUANTITY"
+    VERSION_QUANTITIES_MISMATCH = "VERSION_QUANTITIES_MISMATCH"
+
+
+class Instrumentation:
+    """
+    Opt-in counters and timers of the search and scoring. Code taking an
+     instrumentation skips all bookkeeping when it is None, so there is no cost
+     when it is disabled.
+    """
+
+    def __init__(self):
+        self.nodes_per_depth = defaultdict(int)
+        self.nodes_per_strategy = defaultdict(int)
+        self.prunes = defaultdict(int)
+        self.rejected_solutions = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.timer_calls = defaultdict(int)
+
+    def add_time(self, name: str, seconds: float):
+        self.timers[name] += seconds
+        self.timer_calls[name] += 1
+
+    @contextmanager
+    def timer(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - start)
+
+    def get_report(self) -> dict:
+        return {
+            "nodes_per_depth": dict(sorted(self.nodes_per_depth.items())),
+            "nodes_per_strategy": dict(self.nodes_per_strategy),
+            "prunes": dict(self.prunes),
+            "rejected_solutions": dict(self.rejected_solutions),
+            "timers": {
+                name: {"seconds": seconds, "calls": self.timer_calls[name]}
+                for name, seconds in self.timers.items()
+            },
+        }
+
+    def write_report(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.get_report(), f, indent=2)
@@ -0,0 +1,181 @@
+import heapq
+import json
+import struct
+from abc import ABC, abstractmethod
+from array import array
+
+from solutions import CompactSolution
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+BINARY_RESULTS_MAGIC = b"SVRESLT1"
+BINARY_RECORD_FORMAT = "<qqqqq"
+BINARY_RECORD_SIZE = struct.calcsize(BINARY_RECORD_FORMAT)
+
+
+class ResultsSink(ABC):
+    """
+    Receives (number of packages, solution) of every scored solution. Sinks are
+     context managers, close() flushes buffered output and reports summaries.
+    """
+
+    @abstractmethod
+    def write(self, number_of_packages: int, solution):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PrintResultsSink(ResultsSink):
+    def write(self, number_of_packages: int, solution):
+        print(f"{number_of_packages} | {solution}\n")
+
+
+class JsonlResultsSink(ResultsSink):
+    def __init__(self, path: str, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.file = open(path, "w", buffering=buffer_size)
+
+    def write(self, number_of_packages: int, solution):
+        self.file.write(
+            json.dumps(
+                {
+                    "number_of_packages": number_of_packages,
+                    "line_versions_tuple_list": solution.line_versions_tuple_list,
+                }
+            )
+            + "\n"
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryResultsSink(ResultsSink):
+    """
+    Writes solutions in the CompactSolution layout: a record header with the number
+     of packages and the buffer lengths, followed by the four int32 buffers. Read
+     back with read_binary_results.
+    """
+
+    def __init__(self, path: str, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(BINARY_RESULTS_MAGIC)
+
+    def write(self, number_of_packages: int, solution):
+        compact_solution = CompactSolution.from_solution(solution)
+        buffers = (
+            compact_solution.line_config_offsets,
+            compact_solution.line_offsets,
+            compact_solution.version_ids,
+            compact_solution.counts,
+        )
+        self.file.write(
+            struct.pack(
+                BINARY_RECORD_FORMAT,
+                number_of_packages,
+                *[len(buffer) for buffer in buffers],
+            )
+        )
+        for buffer in buffers:
+            self.file.write(buffer.tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+def read_binary_results(path: str):
+    """
+    Yields (number of packages, CompactSolution) written by BinaryResultsSink.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_RESULTS_MAGIC)) != BINARY_RESULTS_MAGIC:
+            raise ValueError(f"{path} is not a binary results file")
+        while header := f.read(BINARY_RECORD_SIZE):
+            number_of_packages, *buffer_lengths = struct.unpack(
+                BINARY_RECORD_FORMAT, header
+            )
+            buffers = []
+            for buffer_length in buffer_lengths:
+                buffer = array("i")
+                buffer.fromfile(f, buffer_length)
+                buffers.append(buffer)
+            yield number_of_packages, CompactSolution(*buffers)
+
+
+class SummaryResultsSink(ResultsSink):
+    """
+    Quiet mode: keeps only the top_k solutions and summary statistics of the
+     numbers of packages, and prints them on close.
+    """
+
+    def __init__(self, top_k: int = 5):
+        self.top_k = top_k
+        self.top_solutions = []
+        self.number_of_solutions = 0
+        self.sum_of_packages = 0
+        self.min_number_of_packages = None
+        self.max_number_of_packages = None
+
+    def write(self, number_of_packages: int, solution):
+        # Among equal numbers of packages the solution written first is kept
+        scored_solution = (number_of_packages, -self.number_of_solutions, solution)
+        if len(self.top_solutions) < self.top_k:
+            heapq.heappush(self.top_solutions, scored_solution)
+        elif scored_solution[:2] > self.top_solutions[0][:2]:
+            heapq.heapreplace(self.top_solutions, scored_solution)
+
+        self.number_of_solutions += 1
+        self.sum_of_packages += number_of_packages
+        if self.min_number_of_packages is None:
+            self.min_number_of_packages = number_of_packages
+            self.max_number_of_packages = number_of_packages
+        self.min_number_of_packages = min(
+            self.min_number_of_packages, number_of_packages
+        )
+        self.max_number_of_packages = max(
+            self.max_number_of_packages, number_of_packages
+        )
+
+    def get_summary(self) -> dict:
+        return {
+            "number_of_solutions": self.number_of_solutions,
+            "min_number_of_packages": self.min_number_of_packages,
+            "max_number_of_packages": self.max_number_of_packages,
+            "mean_number_of_packages": (
+                self.sum_of_packages / self.number_of_solutions
+                if self.number_of_solutions
+                else None
+            ),
+        }
+
+    def get_top_solutions(self) -> list[tuple[int, object]]:
+        return [
+            (number_of_packages, solution)
+            for number_of_packages, _, solution in sorted(
+                self.top_solutions, key=lambda scored: scored[:2], reverse=True
+            )
+        ]
+
+    def close(self):
+        print(f"Summary: {self.get_summary()}")
+        for number_of_packages, solution in self.get_top_solutions():
+            print(f"{number_of_packages} | {solution}\n")
+
+
+class MultiResultsSink(ResultsSink):
+    def __init__(self, sinks: list[ResultsSink]):
+        self.sinks = sinks
+
+    def write(self, number_of_packages: int, solution):
+        for sink in self.sinks:
+            sink.write(number_of_packages, solution)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,98 @@
+import json
+import os
+from dataclasses import dataclass
+
+from data import CoMailFacility, Line, LineConfiguration
+from results import (
+    BinaryResultsSink,
+    JsonlResultsSink,
+    MultiResultsSink,
+    PrintResultsSink,
+    ResultsSink,
+    SummaryResultsSink,
+)
+from scoring import DEFAULT_SAFETY_MARGIN
+
+DEFAULT_RUN_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "run_config.json")
+
+
+@dataclass
+class RunConfig:
+    """
+    Plan read from a JSON config file (see run_config.json). "lines" lists the
+     line configuration pk of every physical line. "number_of_solutions" is the
+     number of candidate solutions taken from the search in the order they are
+     found, null takes all of them. "results" chooses the output:
+     "path" and "format" ("jsonl" or "binary") write all scored solutions to a file,
+     "quiet" prints only summary statistics and the "top_k" solutions. "screening"
+     with a "sample_fraction" estimates solutions on a sample of zip codes first and
+     scores exactly only the ones which can reach the best one. Parsed input is
+     cached next to the first input file, or in "cache_directory".
+    """
+
+    input_files: list[str]
+    co_mail_facility: CoMailFacility
+    number_of_solutions: int | None = None
+    quiet: bool = False
+    top_k: int = 5
+    results_path: str | None = None
+    results_format: str = "jsonl"
+    sample_fraction: float | None = None
+    safety_margin: float = DEFAULT_SAFETY_MARGIN
+    cache_directory: str | None = None
+
+    @classmethod
+    def from_file(cls, path: str) -> "RunConfig":
+        with open(path) as f:
+            config = json.load(f)
+
+        line_configs = [
+            LineConfiguration(**line_configuration)
+            for line_configuration in config["line_configurations"]
+        ]
+        line_config_map = {line_config.pk: line_config for line_config in line_configs}
+        co_mail_facility = CoMailFacility(
+            line_configs=line_configs,
+            lines=[
+                Line(line_configuration=line_config_map[pk]) for pk in config["lines"]
+            ],
+        )
+
+        # Input paths are relative to the config file
+        config_directory = os.path.dirname(os.path.abspath(path))
+        results = config.get("results", {})
+        results_path = results.get("path")
+        screening = config.get("screening", {})
+        cache_directory = config.get("cache_directory")
+        return cls(
+            input_files=[
+                os.path.join(config_directory, input_file)
+                for input_file in config["input_files"]
+            ],
+            co_mail_facility=co_mail_facility,
+            number_of_solutions=config.get("number_of_solutions"),
+            quiet=results.get("quiet", False),
+            top_k=results.get("top_k", 5),
+            results_path=(
+                os.path.join(config_directory, results_path) if results_path else None
+            ),
+            results_format=results.get("format", "jsonl"),
+            sample_fraction=screening.get("sample_fraction"),
+            safety_margin=screening.get("safety_margin", DEFAULT_SAFETY_MARGIN),
+            cache_directory=(
+                os.path.join(config_directory, cache_directory)
+                if cache_directory
+                else None
+            ),
+        )
+
+    def get_results_sink(self) -> ResultsSink:
+        sinks = [SummaryResultsSink(self.top_k) if self.quiet else PrintResultsSink()]
+        if self.results_path is not None:
+            if self.results_format == "jsonl":
+                sinks.append(JsonlResultsSink(self.results_path))
+            elif self.results_format == "binary":
+                sinks.append(BinaryResultsSink(self.results_path))
+            else:
+                raise ValueError(f"Unknown results format: {self.results_format}")
+        return MultiResultsSink(sinks)
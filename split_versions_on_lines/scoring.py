@@ -0,0 +1,556 @@
+import math
+import os
+import random
+import time
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+
+PACKAGE_SIZE = 10
+
+
+class PackageCountEngine:
+    """
+    Alternative to SolutionChecker.calculate_final_solution working on integer version
+     ids and flat arrays. Only the number of pieces of every version left in a zip code
+     matters for the result, so every zip code is kept as (version id, count) pairs:
+     versions of the zip code with index i are entry_versions[offsets[i]:offsets[i + 1]]
+     and entry_counts holds how many pieces of them are still not packed. The state of
+     a solution is a single copy of entry_counts.
+
+    Entries of version v are version_entries[version_offsets[v]:version_offsets[v + 1]],
+     so a line pass visits only entries of the line's versions instead of all zip codes.
+    """
+
+    # Name and typecode of every array shared with scoring workers, 8-byte ones first
+    #   so that all of them stay aligned in the shared memory block.
+    SHARED_ARRAYS = [
+        ("offsets", "q"),
+        ("version_offsets", "q"),
+        ("version_entries", "q"),
+        ("entry_versions", "i"),
+        ("entry_counts", "i"),
+        ("entry_zips", "i"),
+    ]
+    # Instrumentation timing line passes, set by SolutionChecker
+    instrumentation = None
+
+    def __init__(self, address_mapping, package_size: int = PACKAGE_SIZE):
+        self.package_size = package_size
+        self.zip_codes = []
+        self.offsets = array("q", [0])
+        self.entry_versions = array("i")
+        self.entry_counts = array("i")
+        self.entry_zips = array("i")
+
+        number_of_versions = 0
+        for zip_index, (zip_code, versions) in enumerate(address_mapping.items()):
+            self.zip_codes.append(zip_code)
+            for version_id, count in Counter(versions).items():
+                self.entry_versions.append(version_id)
+                self.entry_counts.append(count)
+                self.entry_zips.append(zip_index)
+                number_of_versions = max(number_of_versions, version_id + 1)
+            self.offsets.append(len(self.entry_versions))
+        self.number_of_versions = number_of_versions
+        self.version_offsets, self.version_entries = self._build_version_index()
+        # Every package takes at least package_size pieces out of one zip code
+        self.max_number_of_packages = sum(
+            sum(self.entry_counts[self.offsets[i] : self.offsets[i + 1]]) // package_size
+            for i in range(len(self.zip_codes))
+        )
+
+    def _build_version_index(self) -> tuple[array, array]:
+        version_offsets = array("q", bytes(8 * (self.number_of_versions + 1)))
+        for version_id in self.entry_versions:
+            version_offsets[version_id + 1] += 1
+        for version_id in range(self.number_of_versions):
+            version_offsets[version_id + 1] += version_offsets[version_id]
+
+        # Entries are added in zip code order, so entries of every version are sorted.
+        positions = version_offsets[:-1]
+        version_entries = array("q", bytes(8 * len(self.entry_versions)))
+        for entry_index, version_id in enumerate(self.entry_versions):
+            version_entries[positions[version_id]] = entry_index
+            positions[version_id] += 1
+        return version_offsets, version_entries
+
+    def share(self) -> tuple[SharedMemory, dict]:
+        """
+        Copies the address arrays into one shared memory block. Returns the block, which
+         the caller has to close and unlink, and a small spec for from_shared_memory.
+        """
+        buffers = [getattr(self, name) for name, _ in self.SHARED_ARRAYS]
+        shared_memory = SharedMemory(
+            create=True, size=max(sum(len(b) * b.itemsize for b in buffers), 1)
+        )
+        position = 0
+        for buffer in buffers:
+            data = buffer.tobytes()
+            shared_memory.buf[position : position + len(data)] = data
+            position += len(data)
+
+        spec = {
+            "name": shared_memory.name,
+            "package_size": self.package_size,
+            "number_of_versions": self.number_of_versions,
+            "max_number_of_packages": self.max_number_of_packages,
+            "lengths": [len(buffer) for buffer in buffers],
+        }
+        return shared_memory, spec
+
+    @classmethod
+    def from_shared_memory(cls, spec: dict) -> "PackageCountEngine":
+        shared_memory = SharedMemory(name=spec["name"])
+
+        engine = cls.__new__(cls)
+        engine.package_size = spec["package_size"]
+        engine.number_of_versions = spec["number_of_versions"]
+        engine.max_number_of_packages = spec["max_number_of_packages"]
+        engine.zip_codes = None
+        position = 0
+        for (name, typecode), length in zip(cls.SHARED_ARRAYS, spec["lengths"]):
+            end = position + length * array(typecode).itemsize
+            setattr(engine, name, shared_memory.buf[position:end].cast(typecode))
+            position = end
+        engine._shared_memory = shared_memory
+        return engine
+
+    def calculate_number_of_packages(self, all_lines_result_tuples) -> int:
+        entry_counts = array("i")
+        entry_counts.frombytes(memoryview(self.entry_counts).cast("B"))
+        number_of_packages = 0
+
+        # Reversed because we want to calculate it from the biggest pocket's line
+        for lines_result_tuple in reversed(all_lines_result_tuples):
+            for line_result_tuple in lines_result_tuple:
+                if self.instrumentation is not None:
+                    line_pass_start = time.perf_counter()
+                number_of_packages += self._pack_line(
+                    entry_counts, self._get_line_pieces_left(line_result_tuple)
+                )
+                if self.instrumentation is not None:
+                    self.instrumentation.add_time(
+                        "scoring.line_pass", time.perf_counter() - line_pass_start
+                    )
+        return number_of_packages
+
+    def _get_line_pieces_left(self, line_result_tuple) -> dict[int, int]:
+        return {
+            version_id: count
+            for version_id, count in {vt[0]: vt[1] for vt in line_result_tuple}.items()
+            if count > 0 and version_id < self.number_of_versions
+        }
+
+    def _get_line_entries(self, line_version_ids) -> list[int]:
+        version_offsets = self.version_offsets
+        version_entries = self.version_entries
+        if len(line_version_ids) == 1:
+            (version_id,) = line_version_ids
+            return version_entries[
+                version_offsets[version_id] : version_offsets[version_id + 1]
+            ]
+
+        line_entries = []
+        for version_id in line_version_ids:
+            line_entries.extend(
+                version_entries[
+                    version_offsets[version_id] : version_offsets[version_id + 1]
+                ]
+            )
+        line_entries.sort()
+        return line_entries
+
+    def _pack_line(self, entry_counts: array, line_pieces_left: dict[int, int]) -> int:
+        """
+        Visits entries of the line's versions in zip code order, so every zip code which
+         holds at least one of them is processed the same way as in a full pass.
+        """
+        entry_versions = self.entry_versions
+        entry_zips = self.entry_zips
+        package_size = self.package_size
+        number_of_packages = 0
+
+        current_zip_index = -1
+        pieces_count = 0
+        taken = []
+        for entry_index in self._get_line_entries(list(line_pieces_left)):
+            zip_index = entry_zips[entry_index]
+            if zip_index != current_zip_index:
+                if pieces_count >= package_size:
+                    for version_id, pieces in taken:
+                        line_pieces_left[version_id] -= pieces
+                    number_of_packages += 1
+                current_zip_index = zip_index
+                pieces_count = 0
+                taken = []
+
+            version_id = entry_versions[entry_index]
+            pieces_left = line_pieces_left[version_id]
+            count = entry_counts[entry_index]
+            if pieces_left > 0 and count:
+                pieces = count if count < pieces_left else pieces_left
+                # Pieces taken by the line leave the zip code even if they do not
+                #   make a full package.
+                entry_counts[entry_index] = count - pieces
+                pieces_count += pieces
+                taken.append((version_id, pieces))
+
+        if pieces_count >= package_size:
+            number_of_packages += 1
+
+        return number_of_packages
+
+
+DEFAULT_PREFIX_CACHE_BUDGET = 512 * 1024 * 1024
+
+
+class PrefixSharingScorer:
+    """
+    Scores solutions with PackageCountEngine, reusing work between solutions which
+     assign the same versions to the first scored lines (the biggest pocket's lines
+     go first). Lines in scoring order are keys of a trie; a trie node can keep the
+     address state (entry_counts) and the number of packages after its prefix.
+     States are evicted in LRU order when they take more than cache_budget bytes and
+     nodes left without a state and children are removed, so the trie stays within
+     the number of cached states times the number of lines.
+    """
+
+    def __init__(
+        self,
+        engine: PackageCountEngine,
+        cache_budget: int = DEFAULT_PREFIX_CACHE_BUDGET,
+    ):
+        self.engine = engine
+        self.cache_budget = cache_budget
+        self.root = self._PrefixNode()
+        self.cached_nodes: OrderedDict = OrderedDict()
+        self.cache_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def calculate_numbers_of_packages(self, all_solutions_lines_result_tuples) -> list:
+        """
+        Scores solutions in trie order, so solutions sharing a prefix are scored one
+         after another, and returns scores in the order of the given solutions.
+        """
+        lines_keys = [
+            self._get_lines_keys(all_lines_result_tuples)
+            for all_lines_result_tuples in all_solutions_lines_result_tuples
+        ]
+        scores = [0] * len(lines_keys)
+        trie_order = sorted(range(len(lines_keys)), key=lines_keys.__getitem__)
+        for solution_index in trie_order:
+            scores[solution_index] = self._calculate_number_of_packages(
+                all_solutions_lines_result_tuples[solution_index],
+                lines_keys[solution_index],
+            )
+        return scores
+
+    def calculate_number_of_packages(self, all_lines_result_tuples) -> int:
+        return self._calculate_number_of_packages(
+            all_lines_result_tuples, self._get_lines_keys(all_lines_result_tuples)
+        )
+
+    def _calculate_number_of_packages(self, all_lines_result_tuples, lines_keys) -> int:
+        lines = [
+            line_result_tuple
+            for lines_result_tuple in reversed(all_lines_result_tuples)
+            for line_result_tuple in lines_result_tuple
+        ]
+
+        # Find the longest prefix with a cached state
+        node = self.root
+        path = []
+        cached_node, cached_depth = None, 0
+        for depth, line_key in enumerate(lines_keys[:-1], start=1):
+            node = node.children.get(line_key)
+            if node is None:
+                break
+            path.append(node)
+            if node.state is not None:
+                cached_node, cached_depth = node, depth
+
+        if cached_node is not None:
+            self.hits += 1
+            self.cached_nodes.move_to_end(id(cached_node))
+            cached_entry_counts, number_of_packages = cached_node.state
+            entry_counts = array("i", cached_entry_counts)
+        else:
+            self.misses += 1
+            entry_counts = array("i")
+            entry_counts.frombytes(memoryview(self.engine.entry_counts).cast("B"))
+            number_of_packages = 0
+
+        node = path[cached_depth - 1] if cached_depth else self.root
+        state_size = len(entry_counts) * entry_counts.itemsize
+        instrumentation = self.engine.instrumentation
+        for depth in range(cached_depth, len(lines)):
+            if instrumentation is not None:
+                line_pass_start = time.perf_counter()
+            number_of_packages += self.engine._pack_line(
+                entry_counts, self.engine._get_line_pieces_left(lines[depth])
+            )
+            if instrumentation is not None:
+                instrumentation.add_time(
+                    "scoring.line_pass", time.perf_counter() - line_pass_start
+                )
+            if depth == len(lines) - 1 or state_size > self.cache_budget:
+                continue
+            child = node.children.get(lines_keys[depth])
+            if child is None:
+                child = self._PrefixNode(node, lines_keys[depth])
+                node.children[child.key] = child
+            node = child
+            self._cache_state(node, entry_counts, number_of_packages, state_size)
+        return number_of_packages
+
+    def _cache_state(self, node, entry_counts, number_of_packages, state_size):
+        if node.state is not None:
+            return
+        # The state is set first, so removing evicted nodes keeps this node's path
+        node.state = (array("i", entry_counts), number_of_packages)
+        while self.cache_size + state_size > self.cache_budget:
+            _, evicted_node = self.cached_nodes.popitem(last=False)
+            evicted_entry_counts, _ = evicted_node.state
+            self.cache_size -= len(evicted_entry_counts) * evicted_entry_counts.itemsize
+            evicted_node.state = None
+            self._remove_unused_nodes(evicted_node)
+        self.cached_nodes[id(node)] = node
+        self.cache_size += state_size
+
+    def _remove_unused_nodes(self, node):
+        # Removes the node and its ancestors while they have no state and no children
+        while node is not self.root and node.state is None and not node.children:
+            del node.parent.children[node.key]
+            node = node.parent
+
+    @staticmethod
+    def _get_lines_keys(all_lines_result_tuples) -> tuple:
+        return tuple(
+            tuple(tuple(vt) for vt in line_result_tuple)
+            for lines_result_tuple in reversed(all_lines_result_tuples)
+            for line_result_tuple in lines_result_tuple
+        )
+
+    class _PrefixNode:
+        __slots__ = ("parent", "key", "children", "state")
+
+        def __init__(self, parent=None, key=None):
+            self.parent = parent
+            self.key = key
+            self.children = {}
+            self.state = None
+
+
+DEFAULT_SAMPLE_FRACTION = 0.1
+DEFAULT_SAFETY_MARGIN = 0.02
+# z value of a two-sided 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+
+@dataclass
+class PackageCountEstimate:
+    number_of_packages: float
+    standard_error: float
+
+    @property
+    def confidence_interval(self) -> tuple[float, float]:
+        margin = CONFIDENCE_Z * self.standard_error
+        return self.number_of_packages - margin, self.number_of_packages + margin
+
+
+class SampledPackageCountEstimator:
+    """
+    Estimates numbers of packages from a stratified sample of zip codes. Zip codes with
+     fewer than package_size pieces never make a package (nor take budget), so they are
+     left out, and the others are grouped by their number of pieces (10-19, 20-39,
+     40-79, ...). sample_fraction of every group, at least 2 zip codes, is packed in
+     zip code order with the full budgets, every package taking its pieces times the
+     number of zip codes its zip code stands for (group size / sample size). So
+     budgets run out at about the same point as in a full pass. The estimate and its
+     standard error follow from the packages per sampled zip code.
+    """
+
+    def __init__(
+        self,
+        engine: PackageCountEngine,
+        sample_fraction: float = DEFAULT_SAMPLE_FRACTION,
+        seed: int = 0,
+    ):
+        self.package_size = engine.package_size
+        random_generator = random.Random(seed)
+
+        offsets = engine.offsets
+        strata = {}
+        for zip_index in range(len(offsets) - 1):
+            number_of_pieces = sum(
+                engine.entry_counts[offsets[zip_index] : offsets[zip_index + 1]]
+            )
+            if number_of_pieces >= self.package_size:
+                stratum = (number_of_pieces // self.package_size).bit_length()
+                strata.setdefault(stratum, []).append(zip_index)
+
+        # Sampled zip codes stay in zip code order, which packing depends on
+        sample = []
+        self.strata = []
+        for zip_indexes in strata.values():
+            sample_size = min(
+                len(zip_indexes), max(round(sample_fraction * len(zip_indexes)), 2)
+            )
+            self.strata.append((len(zip_indexes), sample_size))
+            sample.extend(
+                (zip_index, len(self.strata) - 1)
+                for zip_index in random_generator.sample(zip_indexes, sample_size)
+            )
+        sample.sort()
+        self.sample_strata = array("i", [stratum for _, stratum in sample])
+        self.zip_weights = [
+            stratum_size / sample_size
+            for stratum_size, sample_size in (
+                self.strata[stratum] for stratum in self.sample_strata
+            )
+        ]
+
+        sample_address_mapping = {}
+        for zip_index, _ in sample:
+            versions = []
+            for entry_index in range(offsets[zip_index], offsets[zip_index + 1]):
+                versions.extend(
+                    [engine.entry_versions[entry_index]]
+                    * engine.entry_counts[entry_index]
+                )
+            sample_address_mapping[zip_index] = versions
+        self.sample_engine = PackageCountEngine(
+            sample_address_mapping, self.package_size
+        )
+
+    def estimate(self, all_lines_result_tuples) -> PackageCountEstimate:
+        engine = self.sample_engine
+        entry_counts = array("i", engine.entry_counts)
+        zip_packages = array("i", bytes(4 * len(self.sample_strata)))
+
+        # Reversed because we want to calculate it from the biggest pocket's line
+        for lines_result_tuple in reversed(all_lines_result_tuples):
+            for line_result_tuple in lines_result_tuple:
+                self._pack_line(
+                    entry_counts,
+                    engine._get_line_pieces_left(line_result_tuple),
+                    zip_packages,
+                )
+
+        return self._get_estimate(zip_packages)
+
+    def _pack_line(
+        self,
+        entry_counts: array,
+        line_pieces_left: dict[int, float],
+        zip_packages: array,
+    ):
+        """
+        PackageCountEngine._pack_line on the sample, with packages taking weighted
+         pieces from the budgets.
+        """
+        engine = self.sample_engine
+        entry_versions = engine.entry_versions
+        entry_zips = engine.entry_zips
+        zip_weights = self.zip_weights
+        package_size = self.package_size
+
+        current_zip_index = -1
+        pieces_count = 0
+        taken = []
+        for entry_index in engine._get_line_entries(list(line_pieces_left)):
+            zip_index = entry_zips[entry_index]
+            if zip_index != current_zip_index:
+                if pieces_count >= package_size:
+                    weight = zip_weights[current_zip_index]
+                    for version_id, pieces in taken:
+                        line_pieces_left[version_id] -= pieces * weight
+                    zip_packages[current_zip_index] += 1
+                current_zip_index = zip_index
+                pieces_count = 0
+                taken = []
+
+            version_id = entry_versions[entry_index]
+            pieces_left = line_pieces_left[version_id]
+            count = entry_counts[entry_index]
+            if pieces_left > 0 and count:
+                pieces = count if count < pieces_left else math.ceil(pieces_left)
+                entry_counts[entry_index] = count - pieces
+                pieces_count += pieces
+                taken.append((version_id, pieces))
+
+        if pieces_count >= package_size:
+            zip_packages[current_zip_index] += 1
+
+    def _get_estimate(self, zip_packages) -> PackageCountEstimate:
+        sums = [0] * len(self.strata)
+        sums_of_squares = [0] * len(self.strata)
+        for stratum, number_of_packages in zip(self.sample_strata, zip_packages):
+            sums[stratum] += number_of_packages
+            sums_of_squares[stratum] += number_of_packages * number_of_packages
+
+        number_of_packages = 0.0
+        variance = 0.0
+        for (stratum_size, sample_size), total, total_of_squares in zip(
+            self.strata, sums, sums_of_squares
+        ):
+            mean = total / sample_size
+            number_of_packages += stratum_size * mean
+            if sample_size == stratum_size:
+                continue
+            sample_variance = (total_of_squares - sample_size * mean * mean) / (
+                sample_size - 1
+            )
+            variance += (
+                stratum_size**2
+                * (1 - sample_size / stratum_size)
+                * max(sample_variance, 0.0)
+                / sample_size
+            )
+        return PackageCountEstimate(number_of_packages, math.sqrt(variance))
+
+
+_worker_engine: PackageCountEngine | None = None
+
+
+def _init_scoring_worker(shared_memory_spec: dict):
+    global _worker_engine
+    _worker_engine = PackageCountEngine.from_shared_memory(shared_memory_spec)
+
+
+def _score_in_worker(all_lines_result_tuples) -> int:
+    return _worker_engine.calculate_number_of_packages(all_lines_result_tuples)
+
+
+def calculate_number_of_packages_parallel(
+    engine: PackageCountEngine,
+    all_solutions_lines_result_tuples: list,
+    max_workers: int | None = None,
+) -> list[int]:
+    """
+    Scores solutions in a process pool. Address arrays are put once in shared memory,
+     only solutions and scores are sent between processes. Scores keep solutions order.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(len(all_solutions_lines_result_tuples) // (4 * max_workers), 1)
+    shared_memory, spec = engine.share()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_scoring_worker,
+            initargs=(spec,),
+        ) as executor:
+            return list(
+                executor.map(
+                    _score_in_worker,
+                    all_solutions_lines_result_tuples,
+                    chunksize=chunksize,
+                )
+            )
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
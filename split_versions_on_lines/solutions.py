@@ -0,0 +1,156 @@
+from array import array
+from dataclasses import dataclass, field
+
+
+@dataclass
+class SplitVersionsSolution:
+    line_versions_tuple_list: list[tuple[str, int]] = field(default_factory=list)
+
+
+class CompactSolution:
+    """
+    SplitVersionsSolution packed into flat integer buffers for keeping many candidate
+     solutions in memory. Line i holds version_ids[line_offsets[i]:line_offsets[i + 1]]
+     with the same counts, and line config j holds lines
+     line_config_offsets[j]:line_config_offsets[j + 1]. Version ids must be integers.
+    """
+
+    __slots__ = (
+        "line_config_offsets",
+        "line_offsets",
+        "version_ids",
+        "counts",
+        "_hash",
+    )
+
+    def __init__(
+        self,
+        line_config_offsets: array,
+        line_offsets: array,
+        version_ids: array,
+        counts: array,
+    ):
+        self.line_config_offsets = line_config_offsets
+        self.line_offsets = line_offsets
+        self.version_ids = version_ids
+        self.counts = counts
+        self._hash = None
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactSolution):
+            return NotImplemented
+        return (
+            self.version_ids == other.version_ids
+            and self.counts == other.counts
+            and self.line_offsets == other.line_offsets
+            and self.line_config_offsets == other.line_config_offsets
+        )
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(
+                (
+                    self.line_config_offsets.tobytes(),
+                    self.line_offsets.tobytes(),
+                    self.version_ids.tobytes(),
+                    self.counts.tobytes(),
+                )
+            )
+        return self._hash
+
+    def __repr__(self):
+        return (
+            f"CompactSolution(line_versions_tuple_list={self.line_versions_tuple_list})"
+        )
+
+    def __getstate__(self):
+        # Hashes of bytes differ between processes, so the cached hash is not pickled
+        return (
+            self.line_config_offsets,
+            self.line_offsets,
+            self.version_ids,
+            self.counts,
+        )
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def line_versions_tuple_list(self) -> list[list[list[tuple[int, int]]]]:
+        """
+        Same nested lists as SplitVersionsSolution.line_versions_tuple_list, so check
+         and scoring code can take both solution types.
+        """
+        version_ids = self.version_ids
+        counts = self.counts
+        line_offsets = self.line_offsets
+        line_config_offsets = self.line_config_offsets
+        return [
+            [
+                list(
+                    zip(
+                        version_ids[line_offsets[i] : line_offsets[i + 1]],
+                        counts[line_offsets[i] : line_offsets[i + 1]],
+                    )
+                )
+                for i in range(line_config_offsets[j], line_config_offsets[j + 1])
+            ]
+            for j in range(len(line_config_offsets) - 1)
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            buffer.itemsize * len(buffer)
+            for buffer in (
+                self.line_config_offsets,
+                self.line_offsets,
+                self.version_ids,
+                self.counts,
+            )
+        )
+
+    def to_solution(self) -> SplitVersionsSolution:
+        return SplitVersionsSolution(
+            line_versions_tuple_list=self.line_versions_tuple_list
+        )
+
+    def canonical(self) -> "CompactSolution":
+        """
+        Same solution with the versions of every line sorted by (version id, count).
+         The order inside a line does not change the number of packages, so equal
+         canonical solutions are duplicates.
+        """
+        version_ids = array("i")
+        counts = array("i")
+        line_offsets = self.line_offsets
+        for i in range(len(line_offsets) - 1):
+            start, end = line_offsets[i], line_offsets[i + 1]
+            for version_id, count in sorted(
+                zip(self.version_ids[start:end], self.counts[start:end])
+            ):
+                version_ids.append(version_id)
+                counts.append(count)
+        return CompactSolution(
+            self.line_config_offsets, self.line_offsets, version_ids, counts
+        )
+
+    @classmethod
+    def from_solution(
+        cls, solution: "SplitVersionsSolution | CompactSolution"
+    ) -> "CompactSolution":
+        if isinstance(solution, CompactSolution):
+            return solution
+
+        line_config_offsets = array("i", [0])
+        line_offsets = array("i", [0])
+        version_ids = array("i")
+        counts = array("i")
+        for line_config_solution in solution.line_versions_tuple_list:
+            for line_solution in line_config_solution:
+                for version_id, count in line_solution:
+                    version_ids.append(version_id)
+                    counts.append(count)
+                line_offsets.append(len(version_ids))
+            line_config_offsets.append(len(line_offsets) - 1)
+        return cls(line_config_offsets, line_offsets, version_ids, counts)
@@ -1,28 +1,228 @@
+import hashlib
+import heapq
+import os
+import pickle
+import sys
 import time
-from collections import defaultdict
-from copy import deepcopy
-from dataclasses import dataclass, field
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import accumulate, chain, islice
+from math import gcd
 from typing import Callable
 
-from data import LineConfiguration, CoMailFacility, Line, Version
-from file import get_versions
+from cache import get_versions_cached
+from data import CoMailFacility, Version
+from instrumentation import Instrumentation, PruneReason, RejectionReason
+from results import PrintResultsSink, ResultsSink
+from run_config import DEFAULT_RUN_CONFIG_PATH, RunConfig
+from scoring import (
+    DEFAULT_SAFETY_MARGIN,
+    PackageCountEngine,
+    PrefixSharingScorer,
+    SampledPackageCountEstimator,
+    calculate_number_of_packages_parallel,
+)
+from solutions import CompactSolution, SplitVersionsSolution
+
+
+class SeenSolutions:
+    """
+    Bounded set of the solutions a search has yielded, used to drop duplicates.
+     Solutions are kept as 8-byte digests of their canonical CompactSolution and only
+     the max_size most recently added ones are kept, so memory does not grow with the
+     number of solutions. A duplicate of a solution added more than max_size
+     solutions before is not detected.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.digests: OrderedDict = OrderedDict()
+
+    def add(self, solution: "SplitVersionsSolution | CompactSolution") -> bool:
+        """
+        Adds the solution and returns whether it was not seen before.
+        """
+        canonical_solution = CompactSolution.from_solution(solution).canonical()
+        digest = hashlib.blake2b(digest_size=8)
+        for buffer in (
+            canonical_solution.line_config_offsets,
+            canonical_solution.line_offsets,
+            canonical_solution.version_ids,
+            canonical_solution.counts,
+        ):
+            digest.update(len(buffer).to_bytes(4, "little"))
+            digest.update(buffer.tobytes())
+        key = digest.digest()
+        if key in self.digests:
+            self.digests.move_to_end(key)
+            return False
+        self.digests[key] = None
+        if len(self.digests) > self.max_size:
+            self.digests.popitem(last=False)
+        return True
 
 
-@dataclass
-class SplitVersionsSolution:
-    line_versions_tuple_list: list[tuple[str, int]] = field(default_factory=list)
+@dataclass(frozen=True, slots=True)
+class SolutionPath:
+    """
+    Immutable, structure-sharing solution prefix used during the search. Sibling
+     branches share their parent path, so nothing is copied until a leaf solution
+     is accepted.
+    """
+
+    parent: "SolutionPath | None"
+    line_config_solution: list
+
+    def to_solution(self) -> SplitVersionsSolution:
+        line_versions_tuple_list = []
+        path = self
+        while path is not None:
+            line_versions_tuple_list.append(path.line_config_solution)
+            path = path.parent
+        line_versions_tuple_list.reverse()
+        return SplitVersionsSolution(line_versions_tuple_list=line_versions_tuple_list)
+
+
+class VersionPool:
+    """
+    Versions sorted by quantity in the same order as a stable sort of the version ->
+     quantity mapping, kept up to date between search levels instead of re-sorting the
+     mapping for every split.
+    """
+
+    __slots__ = ("versions", "quantities")
+
+    def __init__(self, versions: list, quantities: list[int]):
+        self.versions = versions
+        self.quantities = quantities
+
+    @classmethod
+    def from_mapping(cls, version_to_quantity_mapping: dict) -> "VersionPool":
+        sorted_items = sorted(version_to_quantity_mapping.items(), key=lambda x: x[1])
+        return cls(
+            [version_id for version_id, _ in sorted_items],
+            [quantity for _, quantity in sorted_items],
+        )
+
+    def insert(self, version_id, quantity: int):
+        # Goes after versions with the same quantity, as it is added to the mapping last
+        index = bisect_right(self.quantities, quantity)
+        self.versions.insert(index, version_id)
+        self.quantities.insert(index, quantity)
+
+
+class SubproblemCache:
+    """
+    LRU cache of search subtree results. Keys are search states, values are the line
+     assignments of all solutions found below that state. The size of an entry is 1
+     plus its number of solution tails. max_size bounds the size of all entries
+     together and subtrees with more than max_entry_size solutions are not cached,
+     so the memory used does not grow with the number of solutions the search yields.
+    """
+
+    def __init__(self, max_size: int, max_entry_size: int | None = None):
+        self.max_size = max_size
+        self.max_entry_size = max_size if max_entry_size is None else max_entry_size
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        if len(value) > self.max_entry_size:
+            return
+        if key in self.entries:
+            self.size -= 1 + len(self.entries[key])
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.size += 1 + len(value)
+        while self.size > self.max_size:
+            _, evicted_value = self.entries.popitem(last=False)
+            self.size -= 1 + len(evicted_value)
+
+
+class TopSolutions:
+    """
+    Keeps the n solutions with the highest score_function(solution) (all of them for
+     n=None) in a bounded min-heap of (score, -index, solution), so among equal
+     scores the solution found first is kept.
+    """
+
+    def __init__(self, n: int | None, score_function: Callable):
+        self.n = n
+        self.score_function = score_function
+        self.scored_solutions = []
+        self.number_of_solutions = 0
+
+    def add(self, solution: SplitVersionsSolution):
+        scored_solution = (
+            self.score_function(solution),
+            -self.number_of_solutions,
+            solution,
+        )
+        self.number_of_solutions += 1
+        if self.n is None or len(self.scored_solutions) < self.n:
+            heapq.heappush(self.scored_solutions, scored_solution)
+        elif scored_solution[:2] > self.scored_solutions[0][:2]:
+            heapq.heapreplace(self.scored_solutions, scored_solution)
+
+    def get_solutions(self) -> list[SplitVersionsSolution]:
+        scored_solutions = sorted(
+            self.scored_solutions, key=lambda scored: scored[:2], reverse=True
+        )
+        return [solution for _, _, solution in scored_solutions]
+
+    def __getstate__(self):
+        # score_function is usually a lambda, so it is passed again after unpickling
+        return {**self.__dict__, "score_function": None}
 
 
 class SplitVersionsGenerator:
+    # Sizes in entries plus solution tails, see SubproblemCache
+    DEFAULT_SUBPROBLEM_CACHE_SIZE = 1_000
+    DEFAULT_SUBPROBLEM_CACHE_ENTRY_SIZE = 100
+    # Versions between the table snapshots of the closest subset search, which it
+    #   replays to find the picked versions
+    SUBSET_SEARCH_SNAPSHOT_INTERVAL = 16
+    # Widest table of sums, in bits, the closest subset search keeps exact
+    SUBSET_SEARCH_MAX_SUM = 1 << 18
+    # Lines whose package upper bound generate_best keeps
+    LINE_UPPER_BOUND_CACHE_SIZE = 1_000
+    # Number of the most recent solutions duplicates are looked up in
+    SEEN_SOLUTIONS_SIZE = 100_000
+    LINE_BALANCING_STEP_LIMIT = 100
 
-    def __init__(self, co_mail_facility: CoMailFacility, versions: list[Version]):
+    def __init__(
+        self,
+        co_mail_facility: CoMailFacility,
+        versions: list[Version],
+        subproblem_cache_size: int = DEFAULT_SUBPROBLEM_CACHE_SIZE,
+        versions_to_split_strategies: list[str] | None = None,
+        instrumentation: Instrumentation | None = None,
+    ):
         self.co_mail_facility = co_mail_facility
+        self.instrumentation = instrumentation
         self.line_configs = self._merge_line_configurations_by_max_limit()
 
         self.versions_to_split_strategy_method_map = {
             self.VersionsToSplitStrategy.AVERAGE_VERSIONS: self.get_versions_to_split_average,
             self.VersionsToSplitStrategy.BIGGEST_VERSIONS: self.get_versions_to_split_the_biggest,
+            self.VersionsToSplitStrategy.CLOSEST_SUBSET: self.get_versions_to_split_closest_subset,
         }
+        self.versions_to_split_strategies = versions_to_split_strategies or [
+            self.VersionsToSplitStrategy.AVERAGE_VERSIONS,
+            self.VersionsToSplitStrategy.BIGGEST_VERSIONS,
+        ]
         self.versions = self._sort_versions_by_quantity(versions)
         self.version_to_quantity_mapping = {
             version.version_id: version.quantity for version in versions
@@ -35,24 +235,279 @@ class SplitVersionsGenerator:
             [lc.pockets * lc.size for lc in self.line_configs]
         )
 
-        self.calculated_solutions: list["SplitVersionsSolution"] = []
+        self.calculated_solutions: list["SplitVersionsSolution | CompactSolution"] = []
+        self.number_of_duplicate_solutions = 0
+        self.subproblem_cache = (
+            SubproblemCache(
+                subproblem_cache_size,
+                min(subproblem_cache_size, self.DEFAULT_SUBPROBLEM_CACHE_ENTRY_SIZE),
+            )
+            if subproblem_cache_size
+            else None
+        )
+
+        # Set only while generate_best is running
+        self.package_count_engine: PackageCountEngine | None = None
+        self.best_number_of_packages = 0
+        self.best_solution: SplitVersionsSolution | None = None
+        self.number_of_pruned_branches = 0
+        self.number_of_package_zip_codes = 0
+        self.line_upper_bounds: OrderedDict = OrderedDict()
 
-    def generate(self, n: int):
+    def generate(
+        self,
+        n: int | None,
+        score_function: Callable | None = None,
+        max_workers: int | None = None,
+        compact: bool = False,
+    ):
+        """
+        Returns at most n valid solutions (all of them for n=None). Without
+         score_function these are the first n solutions found, otherwise the n
+         solutions with the highest score_function(solution), best first, kept in a
+         bounded heap while searching. With max_workers the search runs in a process
+         pool (see iter_solutions_parallel), with the same results. With compact=True
+         solutions are kept as CompactSolution.
+        """
+        solutions = (
+            self.iter_solutions()
+            if max_workers is None
+            else self.iter_solutions_parallel(max_workers)
+        )
+        if compact:
+            solutions = map(CompactSolution.from_solution, solutions)
+        if score_function is None:
+            self.calculated_solutions = list(islice(solutions, n))
+            return self.calculated_solutions
+
+        top_solutions = TopSolutions(n, score_function)
+        for solution in solutions:
+            top_solutions.add(solution)
+        self.calculated_solutions = top_solutions.get_solutions()
+        return self.calculated_solutions
+
+    def iter_solutions(self):
+        """
+        Yields valid solutions one by one, as soon as the search finds them. Duplicates
+         of a solution found before are dropped before they are checked and counted in
+         number_of_duplicate_solutions.
+        """
+        self.number_of_duplicate_solutions = 0
+        seen_solutions = SeenSolutions(self.SEEN_SOLUTIONS_SIZE)
+        for solution in self._search():
+            if not self._is_duplicate_solution(
+                solution, seen_solutions
+            ) and self.is_solution_valid(solution):
+                yield solution
+
+    def _is_duplicate_solution(
+        self, solution: SplitVersionsSolution, seen_solutions: SeenSolutions
+    ) -> bool:
+        """
+        The only place duplicates are dropped. Adds the solution to seen_solutions
+         and counts it in number_of_duplicate_solutions if it was seen before.
+        """
+        if seen_solutions.add(solution):
+            return False
+        self.number_of_duplicate_solutions += 1
+        if self.instrumentation is not None:
+            self.instrumentation.rejected_solutions[RejectionReason.DUPLICATE] += 1
+        return True
+
+    def _search(self):
+        return self.generate_recursive_solution(*self._get_initial_state())
+
+    def _get_initial_state(self):
         max_number_of_all_versions_to_split = self.number_of_all_existing_pockets - len(
             self.versions
         )
         max_number_of_pieces = sum([version.quantity for version in self.versions])
 
-        self.generate_recursive_solution(
+        return (
             self.line_configs,
             self.version_to_quantity_mapping,
             [v.version_id for v in self.versions],
             max_number_of_all_versions_to_split,
             max_number_of_pieces,
-            SplitVersionsSolution(),
+            None,
+            None,
         )
-        self.check_solutions()
-        return self.calculated_solutions
+
+    def iter_solutions_parallel(self, max_workers: int | None = None, depth: int = 1):
+        """
+        iter_solutions running the search subtrees below the first depth line configs
+         in a process pool. Subtree results are collected in search order, so solutions
+         come in the same order as from iter_solutions for any number of workers.
+        """
+        self.number_of_duplicate_solutions = 0
+        seen_solutions = SeenSolutions(self.SEEN_SOLUTIONS_SIZE)
+        search_frontier = list(
+            self._expand_search_frontier(self._get_initial_state(), depth)
+        )
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_search_worker,
+            initargs=(
+                self.co_mail_facility,
+                list(self.version_id_to_version_map.values()),
+                self.subproblem_cache.max_size if self.subproblem_cache else 0,
+                self.versions_to_split_strategies,
+            ),
+        ) as executor:
+            subtrees_solutions = executor.map(
+                _search_subtree_in_worker,
+                [state for solution, state in search_frontier if solution is None],
+            )
+            for solution, state in search_frontier:
+                if solution is None:
+                    # Workers only check validity, duplicates are dropped here in
+                    #   search order
+                    for subtree_solution, is_valid in next(subtrees_solutions):
+                        if (
+                            not self._is_duplicate_solution(
+                                subtree_solution, seen_solutions
+                            )
+                            and is_valid
+                        ):
+                            yield subtree_solution
+                elif not self._is_duplicate_solution(
+                    solution, seen_solutions
+                ) and self.is_solution_valid(solution):
+                    yield solution
+
+    def _expand_search_frontier(self, state, depth: int):
+        """
+        Yields (solution, None) for solutions found above the given depth and
+         (None, state) for search states at that depth, in search order.
+        """
+        if depth == 0:
+            yield None, state
+            return
+
+        (
+            line_configs_left,
+            version_to_quantity_mapping,
+            versions,
+            max_number_of_versions_to_split,
+            number_of_pieces_left,
+            solution_path,
+            version_pool,
+        ) = state
+        last_line_solution_path = self._get_last_line_solution_path(
+            line_configs_left, version_to_quantity_mapping, versions, solution_path
+        )
+        if last_line_solution_path is not None:
+            solution_path = last_line_solution_path
+            yield solution_path.to_solution(), None
+
+        for child_state in self._iter_child_states(
+            line_configs_left,
+            version_to_quantity_mapping,
+            versions,
+            max_number_of_versions_to_split,
+            number_of_pieces_left,
+            solution_path,
+            version_pool,
+        ):
+            yield from self._expand_search_frontier(child_state, depth - 1)
+
+    def generate_best(self, package_count_engine: PackageCountEngine):
+        """
+        Branch-and-bound alternative to generate followed by SolutionChecker. Every
+         valid solution is scored as soon as it is found, and a branch is dropped when
+         its upper bound of packages cannot beat the best solution found so far.
+         Returns the same (number of packages, solution) as scoring all generate
+         results, i.e. the first solution with the highest positive number of packages.
+        """
+        self.package_count_engine = package_count_engine
+        self.best_number_of_packages = 0
+        self.best_solution = None
+        self.number_of_pruned_branches = 0
+        offsets = package_count_engine.offsets
+        entry_counts = package_count_engine.entry_counts
+        self.number_of_package_zip_codes = sum(
+            sum(entry_counts[offsets[i] : offsets[i + 1]])
+            >= package_count_engine.package_size
+            for i in range(len(offsets) - 1)
+        )
+        try:
+            for solution in self.iter_solutions():
+                number_of_packages = package_count_engine.calculate_number_of_packages(
+                    solution.line_versions_tuple_list
+                )
+                if number_of_packages > self.best_number_of_packages:
+                    self.best_number_of_packages = number_of_packages
+                    self.best_solution = solution
+        finally:
+            self.package_count_engine = None
+            self.line_upper_bounds.clear()
+        return self.best_number_of_packages, self.best_solution
+
+    def get_number_of_packages_upper_bound(
+        self,
+        line_configs_left: list["LineConfig"],
+        solution_path: SolutionPath | None,
+        number_of_pieces_left: int,
+    ) -> int:
+        # A line makes at most one package in a zip code, so an assigned line cannot
+        #   make more packages than the zip codes where its versions hold package_size
+        #   pieces. Lines left cannot use more zip codes, pieces or max quantities
+        #   than there are.
+        package_size = self.package_count_engine.package_size
+        upper_bound = 0
+        path = solution_path
+        while path is not None:
+            for line_solution in path.line_config_solution:
+                upper_bound += self._get_line_upper_bound(line_solution)
+            path = path.parent
+
+        upper_bound += min(
+            number_of_pieces_left // package_size,
+            sum(
+                line_config.max_quantity_all_lines // package_size
+                for line_config in line_configs_left
+            ),
+            sum(line_config.size for line_config in line_configs_left)
+            * self.number_of_package_zip_codes,
+        )
+        return min(upper_bound, self.package_count_engine.max_number_of_packages)
+
+    def _get_line_upper_bound(self, line_solution) -> int:
+        """
+        Number of packages the line can make at most, kept in an LRU cache of
+         LINE_UPPER_BOUND_CACHE_SIZE lines as lines are shared between branches.
+        """
+        key = tuple(line_solution)
+        upper_bound = self.line_upper_bounds.get(key)
+        if upper_bound is not None:
+            self.line_upper_bounds.move_to_end(key)
+            return upper_bound
+
+        engine = self.package_count_engine
+        version_offsets = engine.version_offsets
+        version_entries = engine.version_entries
+        entry_zips = engine.entry_zips
+        entry_counts = engine.entry_counts
+        line_pieces_left = engine._get_line_pieces_left(line_solution)
+        # Pieces the line can take in every zip code, at most its count of a version
+        zip_pieces = defaultdict(int)
+        for version_id, pieces_left in line_pieces_left.items():
+            for entry_index in version_entries[
+                version_offsets[version_id] : version_offsets[version_id + 1]
+            ]:
+                count = entry_counts[entry_index]
+                zip_pieces[entry_zips[entry_index]] += (
+                    count if count < pieces_left else pieces_left
+                )
+        upper_bound = min(
+            sum(line_pieces_left.values()) // engine.package_size,
+            sum(pieces >= engine.package_size for pieces in zip_pieces.values()),
+        )
+
+        self.line_upper_bounds[key] = upper_bound
+        if len(self.line_upper_bounds) > self.LINE_UPPER_BOUND_CACHE_SIZE:
+            self.line_upper_bounds.popitem(last=False)
+        return upper_bound
 
     def generate_recursive_solution(
         self,
@@ -61,24 +516,175 @@ class SplitVersionsGenerator:
         versions: list[str],
         max_number_of_versions_to_split: int,
         number_of_pieces_left: int,
-        solution: "SplitVersionsSolution",
+        solution_path: SolutionPath | None,
+        version_pool: VersionPool | None = None,
     ):
-        current_line_config = line_configs_left[0]
-        line_configs_tail = line_configs_left[1:]
+        """
+        Yields (not yet validated) solutions found below the given search state.
+
+        The same search state reached through different branches gives the same
+         solutions tail, so the result of an already explored state is taken from the
+         subproblem cache. Version order is part of the state, as it decides ties in
+         sorting and the order of versions in the results.
+
+        The root state is never reached again, so it is not cached.
 
-        if not line_configs_tail:
-            number_of_used_pieces, version_values_tuple = self.calculate_versions_used(
-                version_to_quantity_mapping, versions
+        In the branch-and-bound mode a state which cannot beat the best solution is
+         dropped. Subtrees with a dropped branch are incomplete, so they are not cached.
+        """
+        if (
+            self.package_count_engine is not None
+            and self.best_number_of_packages > 0
+            and self.get_number_of_packages_upper_bound(
+                line_configs_left, solution_path, number_of_pieces_left
             )
-            if self.is_line_config_valid(
-                number_of_used_pieces,
-                len(version_values_tuple),
-                version_values_tuple,
-                current_line_config,
+            <= self.best_number_of_packages
+        ):
+            self.number_of_pruned_branches += 1
+            if self.instrumentation is not None:
+                self.instrumentation.prunes[PruneReason.UPPER_BOUND] += 1
+            return
+
+        subtree_solutions = self._generate_recursive_solution(
+            line_configs_left,
+            version_to_quantity_mapping,
+            versions,
+            max_number_of_versions_to_split,
+            number_of_pieces_left,
+            solution_path,
+            version_pool,
+        )
+        depth = len(self.line_configs) - len(line_configs_left)
+        if self.subproblem_cache is None or depth == 0:
+            yield from subtree_solutions
+            return
+
+        state = (
+            len(line_configs_left),
+            tuple(version_to_quantity_mapping.items()),
+            tuple(versions),
+            max_number_of_versions_to_split,
+            number_of_pieces_left,
+        )
+        line_config_solutions_tails = self.subproblem_cache.get(state)
+        if line_config_solutions_tails is None:
+            max_entry_size = self.subproblem_cache.max_entry_size
+            number_of_pruned_branches = self.number_of_pruned_branches
+            line_config_solutions_tails = []
+            for solution in subtree_solutions:
+                # Tails of too big subtrees are not kept while the search goes on
+                if line_config_solutions_tails is not None:
+                    line_config_solutions_tails.append(
+                        solution.line_versions_tuple_list[depth:]
+                    )
+                    if len(line_config_solutions_tails) > max_entry_size:
+                        line_config_solutions_tails = None
+                yield solution
+            if (
+                line_config_solutions_tails is not None
+                and self.number_of_pruned_branches == number_of_pruned_branches
             ):
-                if len(versions) == current_line_config.pockets:
-                    solution.line_versions_tuple_list.append([version_values_tuple])
-                    self.calculated_solutions.append(solution)
+                self.subproblem_cache.put(state, line_config_solutions_tails)
+            return
+
+        line_config_solutions_head = (
+            solution_path.to_solution().line_versions_tuple_list
+            if solution_path is not None
+            else []
+        )
+        for line_config_solutions_tail in line_config_solutions_tails:
+            yield SplitVersionsSolution(
+                line_versions_tuple_list=line_config_solutions_head
+                + line_config_solutions_tail
+            )
+
+    def _generate_recursive_solution(
+        self,
+        line_configs_left: list["LineConfig"],
+        version_to_quantity_mapping: dict[str, int],
+        versions: list[str],
+        max_number_of_versions_to_split: int,
+        number_of_pieces_left: int,
+        solution_path: SolutionPath | None,
+        version_pool: VersionPool | None = None,
+    ):
+        last_line_solution_path = self._get_last_line_solution_path(
+            line_configs_left, version_to_quantity_mapping, versions, solution_path
+        )
+        if last_line_solution_path is not None:
+            # Next branches continue from the solution with the last line included
+            solution_path = last_line_solution_path
+            yield solution_path.to_solution()
+
+        for child_state in self._iter_child_states(
+            line_configs_left,
+            version_to_quantity_mapping,
+            versions,
+            max_number_of_versions_to_split,
+            number_of_pieces_left,
+            solution_path,
+            version_pool,
+        ):
+            yield from self.generate_recursive_solution(*child_state)
+
+    def _get_last_line_solution_path(
+        self,
+        line_configs_left: list["LineConfig"],
+        version_to_quantity_mapping: dict[str, int],
+        versions: list[str],
+        solution_path: SolutionPath | None,
+    ) -> SolutionPath | None:
+        current_line_config = line_configs_left[0]
+        if line_configs_left[1:]:
+            return None
+
+        # A grouped line config takes from pockets up to all pockets of its lines,
+        #   as in _iter_child_states
+        if not (
+            current_line_config.pockets
+            <= len(versions)
+            <= current_line_config.pockets * current_line_config.size
+        ):
+            return None
+
+        number_of_used_pieces, version_values_tuple = self.calculate_versions_used(
+            version_to_quantity_mapping, versions
+        )
+        if self.is_line_config_valid(
+            number_of_used_pieces,
+            len(version_values_tuple),
+            version_values_tuple,
+            current_line_config,
+        ):
+            line_config_solution = self.distribute_versions_on_lines(
+                version_values_tuple, current_line_config
+            )
+            if line_config_solution is not None:
+                return SolutionPath(solution_path, line_config_solution)
+        return None
+
+    def _iter_child_states(
+        self,
+        line_configs_left: list["LineConfig"],
+        version_to_quantity_mapping: dict[str, int],
+        versions: list[str],
+        max_number_of_versions_to_split: int,
+        number_of_pieces_left: int,
+        solution_path: SolutionPath | None,
+        version_pool: VersionPool | None,
+    ):
+        """
+        Yields arguments of generate_recursive_solution for every branch of the current
+         line config which passes the checks, in search order.
+        """
+        current_line_config = line_configs_left[0]
+        line_configs_tail = line_configs_left[1:]
+        if version_pool is None:
+            version_pool = VersionPool.from_mapping(version_to_quantity_mapping)
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            depth = len(self.line_configs) - len(line_configs_left)
+            instrumentation.nodes_per_depth[depth] += 1
 
         # If we do not need to use all pockets, lower range starting point here
         for number_of_pockets_to_use in range(
@@ -88,10 +694,7 @@ class SplitVersionsGenerator:
             for number_of_versions_to_split in range(
                 0, min(max_number_of_versions_to_split, number_of_pockets_to_use) + 1
             ):
-                for versions_to_cut_strategy in [
-                    self.VersionsToSplitStrategy.AVERAGE_VERSIONS,
-                    self.VersionsToSplitStrategy.BIGGEST_VERSIONS,
-                ]:
+                for versions_to_cut_strategy in self.versions_to_split_strategies:
                     versions_to_cut_strategy_method = (
                         self.versions_to_split_strategy_method_map[
                             versions_to_cut_strategy
@@ -108,6 +711,10 @@ class SplitVersionsGenerator:
                     ):
                         # Too many versions will go next lines, so they will not fit in all pockets,
                         #   even without splitting.
+                        if instrumentation is not None:
+                            instrumentation.prunes[
+                                PruneReason.TOO_MANY_VERSIONS_FOR_NEXT_LINES
+                            ] += 1
                         continue
 
                     expected_number_of_pieces_to_use = number_of_pieces_left - sum(
@@ -120,20 +727,30 @@ class SplitVersionsGenerator:
                             current_line_config.max_quantity_all_lines,
                         )
 
+                    if instrumentation is not None:
+                        split_start = time.perf_counter()
                     (
                         new_version_to_quantity_mapping,
                         new_versions,
                         number_of_used_pieces,
                         version_values_tuple,
-                    ) = self.split_versions(
+                        new_version_pool,
+                    ) = self.split_versions_in_pool(
                         versions_to_cut_strategy_method,
                         version_to_quantity_mapping,
                         expected_number_of_pieces_to_use,
                         number_of_pockets_to_use,
                         number_of_versions_to_split,
+                        version_pool,
                     )
+                    if instrumentation is not None:
+                        instrumentation.add_time(
+                            "search.split_versions", time.perf_counter() - split_start
+                        )
 
                     if not new_version_to_quantity_mapping:
+                        if instrumentation is not None:
+                            instrumentation.prunes[PruneReason.EMPTY_SPLIT] += 1
                         continue
 
                     if not new_versions:
@@ -147,17 +764,33 @@ class SplitVersionsGenerator:
                         version_values_tuple,
                         current_line_config,
                     ):
+                        if instrumentation is not None:
+                            instrumentation.prunes[PruneReason.INVALID_LINE_CONFIG] += 1
+                        continue
+
+                    line_config_solution = self.distribute_versions_on_lines(
+                        version_values_tuple, current_line_config
+                    )
+                    if line_config_solution is None:
+                        if instrumentation is not None:
+                            instrumentation.prunes[
+                                PruneReason.LINES_BELOW_MIN_QUANTITY
+                            ] += 1
                         continue
 
-                    new_result = deepcopy(solution)
-                    new_result.line_versions_tuple_list.append([version_values_tuple])
-                    self.generate_recursive_solution(
+                    if instrumentation is not None:
+                        instrumentation.nodes_per_strategy[
+                            versions_to_cut_strategy
+                        ] += 1
+
+                    yield (
                         line_configs_tail,
                         new_version_to_quantity_mapping,
                         new_versions,
                         max_number_of_versions_to_split - number_of_versions_to_split,
                         number_of_pieces_left - number_of_used_pieces,
-                        new_result,
+                        SolutionPath(solution_path, line_config_solution),
+                        new_version_pool,
                     )
 
     def split_versions(
@@ -168,23 +801,46 @@ class SplitVersionsGenerator:
         number_of_pockets_to_use,
         number_of_versions_to_split,
     ):
+        return self.split_versions_in_pool(
+            versions_to_split_strategy_method,
+            version_to_quantity_mapping,
+            expected_number_of_pieces_to_use,
+            number_of_pockets_to_use,
+            number_of_versions_to_split,
+            VersionPool.from_mapping(version_to_quantity_mapping),
+        )[:4]
+
+    def split_versions_in_pool(
+        self,
+        versions_to_split_strategy_method: Callable,
+        version_to_quantity_mapping: dict[str, int],
+        expected_number_of_pieces_to_use,
+        number_of_pockets_to_use,
+        number_of_versions_to_split,
+        version_pool: VersionPool,
+    ):
+        """
+        split_versions working on the already sorted version_pool. Returns also the
+         version pool of the versions left for next lines.
+        """
         estimated_number_of_pieces_used_for_split = int(
             expected_number_of_pieces_to_use
             + expected_number_of_pieces_to_use
             * (number_of_versions_to_split / number_of_pockets_to_use)
         )
-        versions, _ = self._sort_versions_by_pieces_used(version_to_quantity_mapping)
+        versions = version_pool.versions
 
         if len(versions) <= number_of_versions_to_split:
             return (
                 version_to_quantity_mapping,
                 versions,
                 *self.calculate_versions_used(version_to_quantity_mapping, versions),
+                version_pool,
             )
 
-        version_values = [
-            version_to_quantity_mapping[version_id] for version_id in versions
-        ]
+        version_values = version_pool.quantities
+        if self.instrumentation is not None:
+            strategy_start = time.perf_counter()
         used_pieces_count, version_values_tuple = versions_to_split_strategy_method(
             version_to_quantity_mapping,
             versions,
@@ -193,16 +849,22 @@ class SplitVersionsGenerator:
             number_of_versions_to_split,
             estimated_number_of_pieces_used_for_split,
         )
+        if self.instrumentation is not None:
+            self.instrumentation.add_time(
+                f"search.{versions_to_split_strategy_method.__name__}",
+                time.perf_counter() - strategy_start,
+            )
 
         used_versions_set = set([vt[0] for vt in version_values_tuple])
         new_version_to_quantity_mapping: dict[str, int] = {}
         new_versions = []
-        for version_id in versions:
+        new_version_values = []
+        for version_id, version_value in zip(versions, version_values):
             if version_id not in used_versions_set:
                 new_versions.append(version_id)
-                new_version_to_quantity_mapping[version_id] = (
-                    version_to_quantity_mapping[version_id]
-                )
+                new_version_values.append(version_value)
+                new_version_to_quantity_mapping[version_id] = version_value
+        new_version_pool = VersionPool(list(new_versions), new_version_values)
 
         if number_of_versions_to_split:
             number_of_pieces_to_split = (
@@ -218,7 +880,8 @@ class SplitVersionsGenerator:
             )
 
             version_to_split_pieces_go_next_mapping: dict[str, int] = {}
-            result = deepcopy(version_values_tuple[:-number_of_versions_to_split])
+            # Tuples are immutable, so a shallow copy of the list is enough here
+            result = version_values_tuple[:-number_of_versions_to_split]
             for i, (version_id, version_count) in enumerate(
                 reversed(result_list_with_elements_to_cut)
             ):
@@ -242,6 +905,7 @@ class SplitVersionsGenerator:
             for version_id, quantity in version_to_split_pieces_go_next_mapping.items():
                 new_version_to_quantity_mapping[version_id] = quantity
                 new_versions.append(version_id)
+                new_version_pool.insert(version_id, quantity)
 
             number_of_used_pieces = expected_number_of_pieces_to_use
         else:
@@ -252,6 +916,7 @@ class SplitVersionsGenerator:
             new_versions,
             number_of_used_pieces,
             version_values_tuple,
+            new_version_pool,
         )
 
     def get_versions_to_split_average(
@@ -262,6 +927,222 @@ class SplitVersionsGenerator:
         pockets: int,
         number_of_versions_to_split: int,
         limit_max: int,
+    ):
+        """
+        Same selection as get_versions_to_split_average_sliding_window, for
+         version_values sorted ascending. As window sums never decrease, the first
+         window reaching limit_max is found by binary search over prefix sums. In the
+         swap-down phase, the lowest index j which still keeps the compartment sum
+         at or above limit_max is found with bisect as well.
+        """
+        if pockets <= 0:
+            return self.get_versions_to_split_average_sliding_window(
+                version_to_quantity_mapping,
+                versions,
+                version_values,
+                pockets,
+                number_of_versions_to_split,
+                limit_max,
+            )
+
+        number_of_versions = len(version_values)
+        compartment_size = min(pockets, number_of_versions)
+        prefix_sums = [0, *accumulate(version_values)]
+
+        low, high = 0, number_of_versions - compartment_size
+        while low < high:
+            middle = (low + high) // 2
+            window_sum = prefix_sums[middle + compartment_size] - prefix_sums[middle]
+            if window_sum >= limit_max:
+                high = middle
+            else:
+                low = middle + 1
+        starting_index = low
+        compartment_sum = (
+            prefix_sums[starting_index + compartment_size] - prefix_sums[starting_index]
+        )
+
+        compartment_indexes = list(
+            range(starting_index, starting_index + compartment_size)
+        )
+        stopping_index = 0
+        for i, index in enumerate(compartment_indexes):
+            if index - 1 < stopping_index:
+                break
+            value = version_values[index]
+            new_value_index = bisect_left(
+                version_values,
+                limit_max - compartment_sum + value,
+                stopping_index,
+                index,
+            )
+            if new_value_index == index:
+                break
+            compartment_sum += version_values[new_value_index] - value
+            compartment_indexes[i] = new_value_index
+            stopping_index = new_value_index + 1
+
+        return self.calculate_versions_used(
+            version_to_quantity_mapping,
+            [versions[index] for index in compartment_indexes],
+        )
+
+    def get_versions_to_split_closest_subset(
+        self,
+        version_to_quantity_mapping: dict[str, int],
+        versions: list[str],
+        version_values: list[int],
+        pockets: int,
+        number_of_versions_to_split: int,
+        limit_max: int,
+    ):
+        """
+        Picks exactly pockets versions (all of them if there are fewer) with the
+         smallest sum which is not below limit_max, or the biggest versions if no subset
+         reaches it. Exact DP over version_values sorted ascending, keeping for every
+         number of picked versions the reachable sums below limit_max as the bits of an
+         int, so adding a version is a shift. The best completion of a sum is the
+         smallest versions left if they bring it to limit_max or more. The picked
+         versions are found by replaying the versions from the table snapshots.
+
+        Quantities and limit_max are divided by the gcd of the quantities first, so the
+         table is limit_max / gcd bits wide and the search takes
+         O(len(versions) * pockets * limit_max / gcd / 64) word operations. If that
+         is above SUBSET_SEARCH_MAX_SUM bits, quantities are rounded down to multiples
+         of step = ceil(limit_max / SUBSET_SEARCH_MAX_SUM) instead, which bounds the
+         search at about 0.25s for 200 versions and 51 pockets. The picked versions
+         still reach limit_max, and their sum is at most pockets * step above the
+         smallest sum reaching limit_max + pockets * step.
+        """
+        if pockets <= 0:
+            return 0, []
+
+        number_of_versions = len(version_values)
+        compartment_size = min(pockets, number_of_versions)
+        prefix_sums = [0, *accumulate(version_values)]
+        biggest_sum = (
+            prefix_sums[number_of_versions]
+            - prefix_sums[number_of_versions - compartment_size]
+        )
+        if biggest_sum < limit_max or prefix_sums[compartment_size] >= limit_max:
+            starting_index = (
+                number_of_versions - compartment_size if biggest_sum < limit_max else 0
+            )
+            return self.calculate_versions_used(
+                version_to_quantity_mapping,
+                versions[starting_index : starting_index + compartment_size],
+            )
+
+        scale = gcd(*version_values)
+        if -(-limit_max // scale) > self.SUBSET_SEARCH_MAX_SUM:
+            scale = -(-limit_max // self.SUBSET_SEARCH_MAX_SUM)
+        if scale > 1:
+            # Scaled sums reaching the scaled limit_max are real sums reaching it
+            version_values = [value // scale for value in version_values]
+            limit_max = -(-limit_max // scale)
+            prefix_sums = [0, *accumulate(version_values)]
+            biggest_sum = (
+                prefix_sums[number_of_versions]
+                - prefix_sums[number_of_versions - compartment_size]
+            )
+
+        # If the biggest versions reach limit_max, there is always a best subset,
+        #   rounded down quantities might not reach it and the biggest ones are taken
+        best_sum = biggest_sum
+        best_path = None
+        # Bit s of reachable_sums[picks] is set if picks of the versions so far sum
+        #   to s, sums from limit_max on are resolved right away and not kept
+        sums_mask = (1 << limit_max) - 1
+        reachable_sums = [1] + [0] * (compartment_size - 1)
+        snapshots = []
+
+        def get_picked_indexes(picks: int, current_sum: int) -> list[int]:
+            # The first version after which current_sum is reachable is the last one
+            #   picked, it is found by replaying the block after the last snapshot
+            #   without current_sum
+            picked_indexes = []
+            interval = self.SUBSET_SEARCH_SNAPSHOT_INTERVAL
+            while picks:
+                block = 0
+                while (
+                    block + 1 < len(snapshots)
+                    and not snapshots[block + 1][picks] >> current_sum & 1
+                ):
+                    block += 1
+                replayed_sums = snapshots[block].copy()
+                index = block * interval
+                while True:
+                    value = version_values[index]
+                    # Counts more than interval below picks cannot reach picks
+                    #   within one block
+                    for lower_picks in range(
+                        picks - 1, max(picks - interval, 0) - 1, -1
+                    ):
+                        replayed_sums[lower_picks + 1] |= (
+                            replayed_sums[lower_picks] << value
+                        ) & sums_mask
+                    if replayed_sums[picks] >> current_sum & 1:
+                        break
+                    index += 1
+                picked_indexes.append(index)
+                picks -= 1
+                current_sum -= value
+            picked_indexes.reverse()
+            return picked_indexes
+
+        for index, value in enumerate(version_values):
+            if best_sum <= limit_max:
+                break
+            if index % self.SUBSET_SEARCH_SNAPSHOT_INTERVAL == 0:
+                snapshots.append(reachable_sums.copy())
+            next_index = index + 1
+            for picks in range(min(index, compartment_size - 1), -1, -1):
+                picks_left = compartment_size - picks - 1
+                if number_of_versions - next_index >= picks_left:
+                    # The smallest versions left are the best completion of any sum
+                    #   they complete to limit_max or more
+                    smallest_completion = (
+                        prefix_sums[next_index + picks_left] - prefix_sums[next_index]
+                    )
+                    lowest_sum = max(limit_max - smallest_completion - value, 0)
+                    completed_sums = reachable_sums[picks] >> lowest_sum
+                    if completed_sums:
+                        current_sum = (
+                            lowest_sum
+                            + (completed_sums & -completed_sums).bit_length()
+                            - 1
+                        )
+                        if current_sum + value + smallest_completion < best_sum:
+                            best_sum = current_sum + value + smallest_completion
+                            best_path = (picks, current_sum, index, picks_left)
+                if picks_left:
+                    reachable_sums[picks + 1] |= (
+                        reachable_sums[picks] << value
+                    ) & sums_mask
+
+        if best_path is None:
+            best_indexes = range(
+                number_of_versions - compartment_size, number_of_versions
+            )
+        else:
+            picks, current_sum, index, picks_left = best_path
+            best_indexes = [
+                *get_picked_indexes(picks, current_sum),
+                index,
+                *range(index + 1, index + 1 + picks_left),
+            ]
+        return self.calculate_versions_used(
+            version_to_quantity_mapping, [versions[index] for index in best_indexes]
+        )
+
+    def get_versions_to_split_average_sliding_window(
+        self,
+        version_to_quantity_mapping: dict[str, int],
+        versions: list[str],
+        version_values: list[int],
+        pockets: int,
+        number_of_versions_to_split: int,
+        limit_max: int,
     ):
         if pockets == 0:
             return 0, []
@@ -363,36 +1244,61 @@ class SplitVersionsGenerator:
         )
 
     def check_solutions(self):
-        valid_solutions = []
-        for solution in self.calculated_solutions:
-            solution_version_to_quantity_mapping = defaultdict(int)
-            failed = False
-            for line_config_index, line_config_solution in enumerate(
-                solution.line_versions_tuple_list
-            ):
-                line_config = self.line_configs[line_config_index]
-                line_config_sum = 0
+        self.calculated_solutions = [
+            solution
+            for solution in self.calculated_solutions
+            if self.is_solution_valid(solution)
+        ]
 
-                for line_solution in line_config_solution:
-                    line_sum = 0
-                    for version_id, count in line_solution:
-                        solution_version_to_quantity_mapping[version_id] += count
-                        line_sum += count
-                    line_config_sum += line_sum
+    def is_solution_valid(
+        self, solution: SplitVersionsSolution | CompactSolution
+    ) -> bool:
+        rejection_reason = self.get_solution_rejection_reason(solution)
+        if rejection_reason is not None and self.instrumentation is not None:
+            self.instrumentation.rejected_solutions[rejection_reason] += 1
+        return rejection_reason is None
+
+    def get_solution_rejection_reason(
+        self, solution: SplitVersionsSolution | CompactSolution
+    ) -> str | None:
+        """
+        Returns the first RejectionReason the solution breaks, None for valid ones.
+        """
+        solution_version_to_quantity_mapping = defaultdict(int)
+        rejection_reason = None
+        for line_config_index, line_config_solution in enumerate(
+            solution.line_versions_tuple_list
+        ):
+            line_config = self.line_configs[line_config_index]
+            line_config_sum = 0
 
-                    if line_sum < line_config.min_quantity_per_line:
-                        failed = True
+            for line_solution in line_config_solution:
+                if len(line_solution) > line_config.pockets:
+                    rejection_reason = (
+                        rejection_reason or RejectionReason.TOO_MANY_VERSIONS_ON_LINE
+                    )
 
-                if line_config_sum > line_config.max_quantity_all_lines:
-                    failed = True
+                line_sum = 0
+                for version_id, count in line_solution:
+                    solution_version_to_quantity_mapping[version_id] += count
+                    line_sum += count
+                line_config_sum += line_sum
 
-            if (
-                solution_version_to_quantity_mapping == self.version_to_quantity_mapping
-                and not failed
-            ):
-                valid_solutions.append(solution)
+                if line_sum < line_config.min_quantity_per_line:
+                    rejection_reason = (
+                        rejection_reason or RejectionReason.LINE_BELOW_MIN_QUANTITY
+                    )
 
-        self.calculated_solutions = valid_solutions
+            if line_config_sum > line_config.max_quantity_all_lines:
+                rejection_reason = (
+                    rejection_reason or RejectionReason.LINE_CONFIG_ABOVE_MAX_QUANTITY
+                )
+
+        if solution_version_to_quantity_mapping != self.version_to_quantity_mapping:
+            rejection_reason = (
+                rejection_reason or RejectionReason.VERSION_QUANTITIES_MISMATCH
+            )
+        return rejection_reason
 
     @staticmethod
     def is_line_config_valid(
@@ -401,7 +1307,6 @@ class SplitVersionsGenerator:
         version_values_tuple,
         current_line_config,
     ):
-        # TODO modify check constraint to remember about grouped lines
         # Check number of versions constraint
         if len(version_values_tuple) != number_of_pockets_to_use:
             return False
@@ -410,10 +1315,80 @@ class SplitVersionsGenerator:
         if number_of_used_pieces > current_line_config.max_quantity_all_lines:
             return False
 
-        # Check min constraint
-        if current_line_config.min_quantity_per_line > number_of_used_pieces:
+        # Check min constraint, every line of the group needs its minimum
+        if (
+            current_line_config.min_quantity_per_line * current_line_config.size
+            > number_of_used_pieces
+        ):
+            return False
+
+        return True
+
+    @classmethod
+    def distribute_versions_on_lines(
+        cls, version_values_tuple: list[tuple[str, int]], line_config: "LineConfig"
+    ) -> list[list[tuple[str, int]]] | None:
+        """
+        Splits the versions chosen for a grouped line config between its lines, at most
+         pockets versions per line. The biggest versions go first to the least loaded
+         line with a free pocket (LPT), then versions are moved or swapped between the
+         heaviest and the lightest line while it narrows the gap. Returns None if any
+         line stays below min_quantity_per_line.
+        """
+        if line_config.size == 1:
+            return [version_values_tuple]
+
+        lines = [[] for _ in range(line_config.size)]
+        loads = [0] * line_config.size
+        lines_heap = [(0, line_index) for line_index in range(line_config.size)]
+        for version_value in sorted(
+            version_values_tuple, key=lambda version_value: -version_value[1]
+        ):
+            load, line_index = heapq.heappop(lines_heap)
+            lines[line_index].append(version_value)
+            loads[line_index] = load + version_value[1]
+            if len(lines[line_index]) < line_config.pockets:
+                heapq.heappush(lines_heap, (loads[line_index], line_index))
+
+        for _ in range(cls.LINE_BALANCING_STEP_LIMIT):
+            if not cls._balance_lines_step(lines, loads, line_config.pockets):
+                break
+
+        if min(loads) < line_config.min_quantity_per_line:
+            return None
+        return lines
+
+    @staticmethod
+    def _balance_lines_step(lines, loads, pockets) -> bool:
+        heaviest = max(range(len(loads)), key=loads.__getitem__)
+        lightest = min(range(len(loads)), key=loads.__getitem__)
+        gap = loads[heaviest] - loads[lightest]
+        best_gap = gap
+        best_move = None
+
+        for i, (_, heavy_count) in enumerate(lines[heaviest]):
+            if len(lines[lightest]) < pockets and abs(gap - 2 * heavy_count) < best_gap:
+                best_gap = abs(gap - 2 * heavy_count)
+                best_move = (i, None)
+            for j, (_, light_count) in enumerate(lines[lightest]):
+                new_gap = abs(gap - 2 * (heavy_count - light_count))
+                if new_gap < best_gap:
+                    best_gap = new_gap
+                    best_move = (i, j)
+
+        if best_move is None:
             return False
 
+        i, j = best_move
+        heavy_version_value = lines[heaviest].pop(i)
+        loads[heaviest] -= heavy_version_value[1]
+        loads[lightest] += heavy_version_value[1]
+        if j is not None:
+            light_version_value = lines[lightest].pop(j)
+            lines[heaviest].append(light_version_value)
+            loads[lightest] -= light_version_value[1]
+            loads[heaviest] += light_version_value[1]
+        lines[lightest].append(heavy_version_value)
         return True
 
     @staticmethod
@@ -472,47 +1447,427 @@ class SplitVersionsGenerator:
     class VersionsToSplitStrategy:
         AVERAGE_VERSIONS = "AVERAGE"
         BIGGEST_VERSIONS = "BIGGEST"
+        CLOSEST_SUBSET = "CLOSEST_SUBSET"
+
+
+class AnytimeSearch:
+    """
+    SplitVersionsGenerator search with an explicit stack of search states instead of
+     recursion. It can stop when a wall-clock or node budget runs out and return the
+     best solutions found so far, and its frontier can be saved to a checkpoint file
+     and resumed later. Solutions are found in the same order as by iter_solutions.
+    """
+
+    def __init__(
+        self,
+        generator: SplitVersionsGenerator,
+        n: int | None = None,
+        score_function: Callable | None = None,
+    ):
+        self.generator = generator
+        self.n = n
+        self.frontier = [generator._get_initial_state()]
+        self.solutions: list[SplitVersionsSolution] = []
+        self.top_solutions = (
+            TopSolutions(n, score_function) if score_function is not None else None
+        )
+        self.seen_solutions = SeenSolutions(generator.SEEN_SOLUTIONS_SIZE)
+        generator.number_of_duplicate_solutions = 0
+        self.number_of_nodes = 0
+
+    @property
+    def is_finished(self) -> bool:
+        if self.top_solutions is None and self.n is not None:
+            return not self.frontier or len(self.solutions) >= self.n
+        return not self.frontier
+
+    def run(
+        self,
+        time_limit: float | None = None,
+        node_limit: int | None = None,
+        checkpoint_path: str | None = None,
+    ) -> list[SplitVersionsSolution]:
+        """
+        Continues the search until it is finished, time_limit seconds pass or
+         node_limit search states are expanded. If the search is not finished and
+         checkpoint_path is given, the frontier is saved there.
+        """
+        deadline = time.time() + time_limit if time_limit is not None else None
+        number_of_nodes = 0
+        while not self.is_finished:
+            if deadline is not None and time.time() >= deadline:
+                break
+            if node_limit is not None and number_of_nodes >= node_limit:
+                break
+            self._expand(self.frontier.pop())
+            number_of_nodes += 1
+
+        if checkpoint_path is not None and not self.is_finished:
+            self.save_checkpoint(checkpoint_path)
+        return self.get_solutions()
+
+    def get_solutions(self) -> list[SplitVersionsSolution]:
+        if self.top_solutions is not None:
+            return self.top_solutions.get_solutions()
+        return list(self.solutions)
+
+    def _expand(self, state):
+        self.number_of_nodes += 1
+        (
+            line_configs_left,
+            version_to_quantity_mapping,
+            versions,
+            max_number_of_versions_to_split,
+            number_of_pieces_left,
+            solution_path,
+            version_pool,
+        ) = state
+        last_line_solution_path = self.generator._get_last_line_solution_path(
+            line_configs_left, version_to_quantity_mapping, versions, solution_path
+        )
+        if last_line_solution_path is not None:
+            solution_path = last_line_solution_path
+            self._add_solution(solution_path.to_solution())
+
+        child_states = list(
+            self.generator._iter_child_states(
+                line_configs_left,
+                version_to_quantity_mapping,
+                versions,
+                max_number_of_versions_to_split,
+                number_of_pieces_left,
+                solution_path,
+                version_pool,
+            )
+        )
+        # Reversed, so the first child is expanded first, as in the recursive search
+        self.frontier.extend(reversed(child_states))
+
+    def _add_solution(self, solution: SplitVersionsSolution):
+        if self.generator._is_duplicate_solution(
+            solution, self.seen_solutions
+        ) or not self.generator.is_solution_valid(solution):
+            return
+        if self.top_solutions is not None:
+            self.top_solutions.add(solution)
+        else:
+            self.solutions.append(solution)
+
+    def save_checkpoint(self, checkpoint_path: str):
+        checkpoint = {
+            "n": self.n,
+            "frontier": self.frontier,
+            "solutions": self.solutions,
+            "top_solutions": self.top_solutions,
+            "seen_solutions": self.seen_solutions,
+            "number_of_duplicate_solutions": (
+                self.generator.number_of_duplicate_solutions
+            ),
+            "number_of_nodes": self.number_of_nodes,
+        }
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, checkpoint_path)
+
+    @classmethod
+    def load_checkpoint(
+        cls,
+        checkpoint_path: str,
+        generator: SplitVersionsGenerator,
+        score_function: Callable | None = None,
+    ) -> "AnytimeSearch":
+        """
+        Restores a search saved by save_checkpoint. generator has to be created for the
+         same facility and versions, score_function is the one used before.
+        """
+        with open(checkpoint_path, "rb") as f:
+            checkpoint = pickle.load(f)
+
+        search = cls(generator, checkpoint["n"])
+        search.frontier = checkpoint["frontier"]
+        search.solutions = checkpoint["solutions"]
+        search.top_solutions = checkpoint["top_solutions"]
+        if search.top_solutions is not None:
+            search.top_solutions.score_function = score_function
+        search.seen_solutions = checkpoint["seen_solutions"]
+        generator.number_of_duplicate_solutions = checkpoint[
+            "number_of_duplicate_solutions"
+        ]
+        search.number_of_nodes = checkpoint["number_of_nodes"]
+        return search
+
+
+_worker_generator: SplitVersionsGenerator | None = None
+
+
+def _init_search_worker(
+    co_mail_facility: CoMailFacility,
+    versions: list[Version],
+    subproblem_cache_size: int,
+    versions_to_split_strategies: list[str],
+):
+    global _worker_generator
+    _worker_generator = SplitVersionsGenerator(
+        co_mail_facility, versions, subproblem_cache_size, versions_to_split_strategies
+    )
+
+
+def _search_subtree_in_worker(state) -> list[tuple[SplitVersionsSolution, bool]]:
+    """
+    Returns the solutions of the subtree, each with whether it is valid.
+    """
+    return [
+        (solution, _worker_generator.is_solution_valid(solution))
+        for solution in _worker_generator.generate_recursive_solution(*state)
+    ]
 
 
 class SolutionChecker:
 
     def __init__(
         self,
-        split_versions_solutions: list[SplitVersionsSolution],
+        split_versions_solutions: list[SplitVersionsSolution | CompactSolution],
         address_mapping,
         line_configs,
+        use_package_count_engine: bool = False,
+        prefix_cache_budget: int | None = None,
+        instrumentation: Instrumentation | None = None,
+        sample_fraction: float | None = None,
+        safety_margin: float = DEFAULT_SAFETY_MARGIN,
+        quiet: bool = False,
     ):
+        """
+        With sample_fraction, solutions are screened on a stratified sample of zip codes
+         before exact scoring (see screen_solutions). With quiet, progress and the best
+         solution are not printed, results only go to the results sink.
+        """
         self.split_versions_solutions = split_versions_solutions
         self.address_mapping = address_mapping
         self.line_configs = line_configs
+        self.package_count_engine = (
+            PackageCountEngine(address_mapping)
+            if use_package_count_engine or prefix_cache_budget is not None
+            else None
+        )
+        self.prefix_sharing_scorer = (
+            PrefixSharingScorer(self.package_count_engine, prefix_cache_budget)
+            if prefix_cache_budget is not None
+            else None
+        )
+        self.sampled_package_count_estimator = (
+            SampledPackageCountEstimator(
+                self.package_count_engine or PackageCountEngine(address_mapping),
+                sample_fraction,
+            )
+            if sample_fraction is not None
+            else None
+        )
+        self.safety_margin = safety_margin
+        self.package_count_estimates = []
+        self.number_of_screened_out_solutions = 0
+        # (index among screened solutions, exact number of packages) of the solution
+        #   with the best estimate
+        self.best_estimate_solution = None
+        self.quiet = quiet
+        self.instrumentation = instrumentation
+        if instrumentation is not None and self.package_count_engine is not None:
+            self.package_count_engine.instrumentation = instrumentation
+
+    def calculate_solutions(
+        self,
+        parallel: bool = False,
+        max_workers: int | None = None,
+        results_sink: ResultsSink | None = None,
+    ):
+        """
+        Scores all solutions and returns (best number of packages, best solution lines).
+         Every scored solution goes to results_sink, printed by default. A given
+         results_sink is not closed, so one sink can collect results of many calls.
+        """
+        if not self.quiet:
+            print("Calculating solutions \n")
+        instrumentation = self.instrumentation
+        split_versions_solutions = self.split_versions_solutions
 
-    def calculate_solutions(self):
-        print("Calculating solutions \n")
-        best_solution = 0
-        best_version_solution = None
-        for solution in self.split_versions_solutions:
+        all_solutions_lines_result_tuples = []
+        for solution in split_versions_solutions:
             all_lines_result_tuples = []
             # print(f"Splitting versions for: {valid_result}")
             for i, line_result_tuple in enumerate(solution.line_versions_tuple_list):
                 all_lines_result_tuples.append(line_result_tuple)
+            all_solutions_lines_result_tuples.append(all_lines_result_tuples)
+
+        # (index, number of packages) of a solution already scored exactly
+        scored_solution = None
+        if self.sampled_package_count_estimator is not None:
+            if instrumentation is not None:
+                screening_start = time.perf_counter()
+            (
+                split_versions_solutions,
+                all_solutions_lines_result_tuples,
+            ) = self.screen_solutions(
+                split_versions_solutions, all_solutions_lines_result_tuples
+            )
+            scored_solution = self.best_estimate_solution
+            if instrumentation is not None:
+                instrumentation.add_time(
+                    "scoring.screening", time.perf_counter() - screening_start
+                )
+
+        solutions_lines_to_score = all_solutions_lines_result_tuples
+        if scored_solution is not None:
+            solutions_lines_to_score = (
+                all_solutions_lines_result_tuples[: scored_solution[0]]
+                + all_solutions_lines_result_tuples[scored_solution[0] + 1 :]
+            )
+
+        if instrumentation is not None:
+            batch_start = time.perf_counter()
+        if parallel:
+            final_solutions = calculate_number_of_packages_parallel(
+                self.package_count_engine or PackageCountEngine(self.address_mapping),
+                solutions_lines_to_score,
+                max_workers=max_workers,
+            )
+            if instrumentation is not None:
+                instrumentation.add_time(
+                    "scoring.parallel", time.perf_counter() - batch_start
+                )
+        elif self.prefix_sharing_scorer is not None:
+            final_solutions = self.prefix_sharing_scorer.calculate_numbers_of_packages(
+                solutions_lines_to_score
+            )
+            if instrumentation is not None:
+                instrumentation.add_time(
+                    "scoring.prefix_sharing", time.perf_counter() - batch_start
+                )
+        else:
+            final_solutions = map(
+                self.calculate_number_of_packages, solutions_lines_to_score
+            )
+        if scored_solution is not None:
+            index, number_of_packages = scored_solution
+            final_solutions = iter(final_solutions)
+            final_solutions = chain(
+                islice(final_solutions, index), [number_of_packages], final_solutions
+            )
 
-            final_solution = self.calculate_final_solution(all_lines_result_tuples)
-            print(f"{final_solution} | {solution}\n")
+        best_solution = 0
+        best_version_solution = None
+        output_sink = results_sink or PrintResultsSink()
+        for solution, all_lines_result_tuples, final_solution in zip(
+            split_versions_solutions,
+            all_solutions_lines_result_tuples,
+            final_solutions,
+        ):
+            output_sink.write(final_solution, solution)
 
             if final_solution > best_solution:
                 best_solution = final_solution
                 best_version_solution = all_lines_result_tuples
 
-        print(f"------- BEST SOLUTION: {best_solution}")
-        print(best_version_solution)
+        if results_sink is None:
+            output_sink.close()
+
+        if not self.quiet:
+            print(f"------- BEST SOLUTION: {best_solution}")
+            print(best_version_solution)
+        return best_solution, best_version_solution
+
+    def screen_solutions(
+        self, split_versions_solutions, all_solutions_lines_result_tuples
+    ) -> tuple[list, list]:
+        """
+        Scores the solution with the best estimate exactly and returns the solutions
+         (and their lines) which can reach it, in the given order. A solution can reach
+         it if the upper bound of its confidence interval plus safety_margin of the
+         exact number of packages is not below it. The exact number is kept in
+         best_estimate_solution, so calculate_solutions does not score it again.
+        """
+        self.best_estimate_solution = None
+        estimator = self.sampled_package_count_estimator
+        self.package_count_estimates = [
+            estimator.estimate(all_lines_result_tuples)
+            for all_lines_result_tuples in all_solutions_lines_result_tuples
+        ]
+        if not self.package_count_estimates:
+            return split_versions_solutions, all_solutions_lines_result_tuples
+
+        best_index = max(
+            range(len(self.package_count_estimates)),
+            key=lambda i: self.package_count_estimates[i].number_of_packages,
+        )
+        best_estimate = self.package_count_estimates[best_index]
+        best_number_of_packages = self.calculate_number_of_packages(
+            all_solutions_lines_result_tuples[best_index]
+        )
+        safety_margin = self.safety_margin * best_number_of_packages
+        screened = []
+        for i, (solution, all_lines_result_tuples, estimate) in enumerate(
+            zip(
+                split_versions_solutions,
+                all_solutions_lines_result_tuples,
+                self.package_count_estimates,
+            )
+        ):
+            _, upper_bound = estimate.confidence_interval
+            if (
+                i == best_index
+                or upper_bound + safety_margin >= best_number_of_packages
+            ):
+                if i == best_index:
+                    self.best_estimate_solution = (
+                        len(screened),
+                        best_number_of_packages,
+                    )
+                screened.append((solution, all_lines_result_tuples))
+        self.number_of_screened_out_solutions = len(split_versions_solutions) - len(
+            screened
+        )
+
+        if not self.quiet:
+            low, high = best_estimate.confidence_interval
+            print(
+                f"Best estimate: {best_estimate.number_of_packages:.0f}"
+                f" (95% CI {low:.0f}-{high:.0f}), exact: {best_number_of_packages}"
+            )
+            print(
+                f"Screened out {self.number_of_screened_out_solutions} of"
+                f" {len(split_versions_solutions)} solutions\n"
+            )
+        return [solution for solution, _ in screened], [
+            all_lines_result_tuples for _, all_lines_result_tuples in screened
+        ]
+
+    def calculate_number_of_packages(self, all_lines_result_tuples):
+        if self.instrumentation is not None:
+            with self.instrumentation.timer("scoring.solution"):
+                return self._calculate_number_of_packages(all_lines_result_tuples)
+        return self._calculate_number_of_packages(all_lines_result_tuples)
+
+    def _calculate_number_of_packages(self, all_lines_result_tuples):
+        if self.prefix_sharing_scorer is not None:
+            return self.prefix_sharing_scorer.calculate_number_of_packages(
+                all_lines_result_tuples
+            )
+        if self.package_count_engine is not None:
+            return self.package_count_engine.calculate_number_of_packages(
+                all_lines_result_tuples
+            )
+        return self.calculate_final_solution(all_lines_result_tuples)
 
     def calculate_final_solution(self, all_lines_result_tuples):
-        new_address_mapping = deepcopy(self.address_mapping)
+        # Every pass builds new version lists, so the input mapping (dict or
+        #   CompactAddressMapping) is only read and does not have to be copied.
+        new_address_mapping = self.address_mapping
         number_of_packages = 0
 
         # Reversed because we want to calculate it from the biggest pocket's line
         for lines_result_tuple in reversed(all_lines_result_tuples):
             for line_result_tuple in lines_result_tuple:
+                if self.instrumentation is not None:
+                    line_pass_start = time.perf_counter()
 
                 new_new_address_mapping = {}
                 line_result_versions_mapping = {
@@ -543,59 +1898,46 @@ class SolutionChecker:
                     new_new_address_mapping[zip_code] = new_versions
 
                 new_address_mapping = new_new_address_mapping
+                if self.instrumentation is not None:
+                    self.instrumentation.add_time(
+                        "scoring.line_pass", time.perf_counter() - line_pass_start
+                    )
 
         return number_of_packages
 
 
-def run():
-    line_config_51 = LineConfiguration(
-        pk=1,
-        pockets=51,
-        min_quantity_per_line=100_000,
-        max_quantity_all_lines=3_500_000,
-    )
-    line_config_40 = LineConfiguration(
-        pk=2,
-        pockets=40,
-        min_quantity_per_line=100_000,
-        max_quantity_all_lines=3_500_000,
-    )
-    line_config_30 = LineConfiguration(
-        pk=3,
-        pockets=30,
-        min_quantity_per_line=150_000,
-        max_quantity_all_lines=15_000_000,
-    )
-    co_mail_facility = CoMailFacility(
-        line_configs=[line_config_51, line_config_40, line_config_30],
-        lines=[
-            Line(
-                line_configuration=line_config_51,
-            ),
-            Line(
-                line_configuration=line_config_40,
-            ),
-            Line(
-                line_configuration=line_config_30,
-            ),
-        ],
-    )
+def run(config_path: str = DEFAULT_RUN_CONFIG_PATH):
+    config = RunConfig.from_file(config_path)
 
-    versions, address_mapping = get_versions(["10mln-prod.csv"])
+    versions, address_mapping = get_versions_cached(
+        config.input_files, cache_directory=config.cache_directory
+    )
     start = time.time()
-    generator = SplitVersionsGenerator(co_mail_facility, versions)
-    solutions = generator.generate(5)
+    generator = SplitVersionsGenerator(config.co_mail_facility, versions)
+    # Candidates are not scored while searching, SolutionChecker screens them and
+    #   scores them in parallel
+    solutions = generator.generate(config.number_of_solutions, compact=True)
     end = time.time()
-    print(f"{end - start} seconds")
-    print(len(solutions))
+    if not config.quiet:
+        print(f"{end - start} seconds")
+        print(len(solutions))
+        print(f"Dropped {generator.number_of_duplicate_solutions} duplicate solutions")
 
     start = time.time()
-    SolutionChecker(
-        solutions, address_mapping, generator.line_configs
-    ).calculate_solutions()
+    with config.get_results_sink() as results_sink:
+        SolutionChecker(
+            solutions,
+            address_mapping,
+            generator.line_configs,
+            use_package_count_engine=True,
+            sample_fraction=config.sample_fraction,
+            safety_margin=config.safety_margin,
+            quiet=config.quiet,
+        ).calculate_solutions(parallel=True, results_sink=results_sink)
     end = time.time()
-    print(f"{end - start} seconds")
+    if not config.quiet:
+        print(f"{end - start} seconds")
 
 
 if __name__ == "__main__":
-    run()
+    run(*sys.argv[1:])
@@ -0,0 +1,54 @@
+import pytest
+
+from cache import get_source_signature, get_versions_cached, read_cache
+from file import get_versions
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    file_path = tmp_path / "input.csv"
+    file_path.write_text("z1,V1\nz2,V1\nz1,V2\nz3,V3\nz2,V2\n")
+    return str(file_path)
+
+
+def test_cached_load_matches_load(tmp_path, input_file):
+    cache_path = str(tmp_path / "input.cache")
+    expected = get_versions([input_file])
+
+    assert get_versions_cached([input_file], cache_path, compact=False) == expected
+    # Second call reads the cache file
+    assert get_versions_cached([input_file], cache_path, compact=False) == expected
+
+
+@pytest.mark.parametrize(
+    "content",
+    [b"", b"SVCACHE1", b"SVCACHE1\x05\x00\x00\x00\x00\x00\x00\x00{nope"],
+)
+def test_corrupt_cache_is_rebuilt(tmp_path, input_file, content):
+    cache_path = tmp_path / "input.cache"
+    cache_path.write_bytes(content)
+
+    assert read_cache(str(cache_path), get_source_signature([input_file])) is None
+    assert get_versions_cached(
+        [input_file], str(cache_path), compact=False
+    ) == get_versions([input_file])
+    assert read_cache(str(cache_path)) is not None
+
+
+def test_truncated_cache_is_rebuilt(tmp_path, input_file):
+    cache_path = tmp_path / "input.cache"
+    get_versions_cached([input_file], str(cache_path))
+    cache_path.write_bytes(cache_path.read_bytes()[:-4])
+
+    assert read_cache(str(cache_path)) is None
+    assert get_versions_cached(
+        [input_file], str(cache_path), compact=False
+    ) == get_versions([input_file])
+
+
+def test_unwritable_cache_is_skipped(tmp_path, input_file):
+    cache_directory = str(tmp_path / "missing")
+
+    assert get_versions_cached(
+        [input_file], compact=False, cache_directory=cache_directory
+    ) == get_versions([input_file])
@@ -0,0 +1,37 @@
+import pytest
+
+from file import load_from_file
+
+
+def write_input_file(tmp_path, content):
+    file_path = tmp_path / "input.csv"
+    file_path.write_text(content)
+    return str(file_path)
+
+
+@pytest.mark.parametrize("delimiter", [",", "|"])
+def test_chunked_load_matches_readline_load(tmp_path, delimiter):
+    content = "".join(
+        f"{zip_code:05d}{delimiter}V{version}\n"
+        for zip_code, version in [(1, 1), (2, 1), (1, 2), (3, 3), (2, 2), (1, 1)]
+    )
+    file_path = write_input_file(tmp_path, content)
+
+    assert load_from_file([file_path], chunked=True) == load_from_file([file_path])
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "z1,V1,x\nz2,V2,y\n",
+        "z1\nz2,V2,x\n",
+        "z1,V1\nz2\nz3,V3,x\n",
+    ],
+)
+def test_malformed_rows_raise(tmp_path, content):
+    file_path = write_input_file(tmp_path, content)
+
+    with pytest.raises(ValueError):
+        load_from_file([file_path])
+    with pytest.raises(ValueError):
+        load_from_file([file_path], chunked=True)
@@ -0,0 +1,138 @@
+import random
+from collections import Counter
+
+import pytest
+
+from benchmark import generate_co_mail_facility
+from data import Version
+from incremental import IncrementalPlanner
+from scoring import PackageCountEngine
+
+
+def generate_planner(random_generator):
+    number_of_versions = random_generator.randint(8, 25)
+    number_of_zip_codes = random_generator.randint(20, 200)
+    weights = [1 / (version_id + 1) for version_id in range(number_of_versions)]
+    address_mapping = {}
+    for _ in range(random_generator.randint(500, 4_000)):
+        zip_code = f"z{random_generator.randrange(number_of_zip_codes)}"
+        address_mapping.setdefault(zip_code, []).append(
+            random_generator.choices(range(number_of_versions), weights)[0]
+        )
+    quantities = Counter(
+        version_id
+        for zip_version_ids in address_mapping.values()
+        for version_id in zip_version_ids
+    )
+    # Version ids have to be 0..n-1, like the ones of a loaded input file
+    version_ids = {version_id: i for i, version_id in enumerate(sorted(quantities))}
+    address_mapping = {
+        zip_code: [version_ids[version_id] for version_id in zip_version_ids]
+        for zip_code, zip_version_ids in address_mapping.items()
+    }
+    versions = [
+        Version(version_id=i, quantity=quantities[version_id])
+        for version_id, i in version_ids.items()
+    ]
+    co_mail_facility = generate_co_mail_facility(
+        versions, random_generator.choice([2, 3])
+    )
+    if random_generator.random() < 0.5:
+        for line_config in co_mail_facility.line_configs:
+            line_config.min_quantity_per_line //= 4
+    return IncrementalPlanner(
+        co_mail_facility,
+        versions,
+        [f"V{version_id}" for version_id in range(len(versions))],
+        address_mapping,
+        number_of_solutions=5,
+    )
+
+
+def generate_delta(random_generator, planner):
+    """
+    Random delta of added pieces, also in new zip codes, and removed pieces which the
+     zip codes have.
+    """
+    delta = Counter()
+    for _ in range(random_generator.randint(1, 15)):
+        if random_generator.random() < 0.9:
+            zip_code = random_generator.choice(planner.zip_contents.zip_codes)
+        else:
+            zip_code = f"new{random_generator.randrange(5)}"
+        zip_index = planner.zip_contents.zip_indexes.get(zip_code)
+        content = planner.zip_contents.get(zip_index) if zip_index is not None else {}
+        version_ids = [version_id for version_id, count in content.items() if count]
+        if version_ids and random_generator.random() < 0.5:
+            version_pk = planner.version_names[random_generator.choice(version_ids)]
+            count = planner.zip_contents.get_count(
+                zip_code, planner.version_ids_by_name[version_pk]
+            )
+            if count + delta[(zip_code, version_pk)] > 0:
+                delta[(zip_code, version_pk)] -= 1
+        else:
+            version_pk = random_generator.choice(planner.version_names)
+            delta[(zip_code, version_pk)] += random_generator.randint(1, 20)
+    return delta
+
+
+def calculate_numbers_of_packages(planner):
+    package_count_engine = PackageCountEngine(
+        {
+            zip_code: [
+                version_id
+                for version_id, count in content.items()
+                for _ in range(count)
+            ]
+            for zip_code, content in planner.zip_contents.items()
+        }
+    )
+    return [
+        package_count_engine.calculate_number_of_packages(
+            solution.line_versions_tuple_list
+        )
+        for solution in planner.solutions
+    ]
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_incremental_package_counts_match_full_scoring(seed):
+    random_generator = random.Random(seed)
+    planner = generate_planner(random_generator)
+    if not planner.solutions:
+        pytest.skip("No solutions for this facility")
+
+    assert planner.numbers_of_packages == calculate_numbers_of_packages(planner)
+    for _ in range(6):
+        planner.apply_delta(generate_delta(random_generator, planner))
+
+        assert planner.numbers_of_packages == calculate_numbers_of_packages(planner)
+
+
+def test_invalid_delta_changes_nothing():
+    planner = generate_planner(random.Random(0))
+    zip_code = planner.zip_contents.zip_codes[0]
+    version_id, count = next(iter(planner.zip_contents.get(0).items()))
+    other_version_id = next(
+        other_version_id
+        for other_version_id in planner.zip_contents.get(0)
+        if other_version_id != version_id
+    )
+    version_quantities = dict(planner.version_quantities)
+    solutions = list(planner.solutions)
+    numbers_of_packages = planner.numbers_of_packages
+    delta = Counter(
+        {
+            (zip_code, planner.version_names[version_id]): 5,
+            (zip_code, planner.version_names[other_version_id]): -(10**6),
+        }
+    )
+
+    with pytest.raises(ValueError):
+        planner.apply_delta(delta)
+
+    assert planner.zip_contents.get(0)[version_id] == count
+    assert not planner.zip_contents.overrides
+    assert planner.version_quantities == version_quantities
+    assert planner.solutions == solutions
+    assert planner.numbers_of_packages == numbers_of_packages
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from scoring import PackageCountEngine, PrefixSharingScorer
+from split_versions_algorithm import SolutionChecker
+
+
+def generate_address_mapping(random_generator, number_of_versions):
+    return {
+        f"{zip_code:05d}": [
+            random_generator.randrange(number_of_versions)
+            for _ in range(random_generator.choice([0, 3, 9, 10, 15, 40]))
+        ]
+        for zip_code in range(random_generator.randint(1, 60))
+    }
+
+
+def generate_all_lines_result_tuples(random_generator, number_of_versions):
+    """
+    Random solution lines: some versions on many lines, some on none, budgets from 0
+     to more than all pieces of a version.
+    """
+    return [
+        [
+            [
+                (version_id, random_generator.randint(0, 120))
+                for version_id in random_generator.sample(
+                    range(number_of_versions),
+                    random_generator.randint(1, number_of_versions),
+                )
+            ]
+            for _ in range(random_generator.randint(1, 3))
+        ]
+        for _ in range(random_generator.randint(1, 4))
+    ]
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_package_count_engine_matches_calculate_final_solution(seed):
+    random_generator = random.Random(seed)
+    number_of_versions = random_generator.randint(1, 8)
+    address_mapping = generate_address_mapping(random_generator, number_of_versions)
+    checker = SolutionChecker([], address_mapping, line_configs=None)
+    engine = PackageCountEngine(address_mapping)
+    prefix_sharing_scorer = PrefixSharingScorer(engine)
+
+    for _ in range(5):
+        all_lines_result_tuples = generate_all_lines_result_tuples(
+            random_generator, number_of_versions
+        )
+        expected = checker.calculate_final_solution(all_lines_result_tuples)
+
+        assert engine.calculate_number_of_packages(all_lines_result_tuples) == expected
+        assert (
+            prefix_sharing_scorer.calculate_number_of_packages(all_lines_result_tuples)
+            == expected
+        )
+        assert expected <= engine.max_number_of_packages
+
+
+def get_trie_nodes(node):
+    for child in node.children.values():
+        yield child
+        yield from get_trie_nodes(child)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_prefix_sharing_scorer_with_a_small_cache_budget(seed):
+    random_generator = random.Random(seed)
+    number_of_versions = random_generator.randint(1, 8)
+    address_mapping = generate_address_mapping(random_generator, number_of_versions)
+    engine = PackageCountEngine(address_mapping)
+    state_size = len(engine.entry_counts) * engine.entry_counts.itemsize
+    prefix_sharing_scorer = PrefixSharingScorer(engine, cache_budget=3 * state_size)
+    shared_lines = generate_all_lines_result_tuples(
+        random_generator, number_of_versions
+    )
+    all_solutions_lines_result_tuples = [
+        generate_all_lines_result_tuples(random_generator, number_of_versions)
+        + shared_lines[random_generator.randint(0, len(shared_lines)) :]
+        for _ in range(50)
+    ]
+
+    assert prefix_sharing_scorer.calculate_numbers_of_packages(
+        all_solutions_lines_result_tuples
+    ) == [
+        engine.calculate_number_of_packages(all_lines_result_tuples)
+        for all_lines_result_tuples in all_solutions_lines_result_tuples
+    ]
+    assert prefix_sharing_scorer.cache_size <= 3 * state_size
+    assert len(prefix_sharing_scorer.cached_nodes) <= 3
+    assert prefix_sharing_scorer.hits > 0
+    # Evicted states leave no nodes behind, every node keeps a state or leads to one
+    trie_nodes = list(get_trie_nodes(prefix_sharing_scorer.root))
+    assert all(node.state is not None or node.children for node in trie_nodes)
+    assert len(trie_nodes) <= 3 * max(
+        sum(map(len, all_lines_result_tuples))
+        for all_lines_result_tuples in all_solutions_lines_result_tuples
+    )
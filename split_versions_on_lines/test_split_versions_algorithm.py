@@ -0,0 +1,342 @@
+import random
+
+import pytest
+
+from benchmark import generate_co_mail_facility, generate_input_file
+from data import CoMailFacility, Line, LineConfiguration, Version
+from file import get_versions
+from scoring import PackageCountEngine
+from split_versions_algorithm import (
+    CompactSolution,
+    SeenSolutions,
+    SolutionChecker,
+    SplitVersionsGenerator,
+)
+
+
+def generate_versions(random_generator, number_of_versions):
+    return [
+        Version(
+            version_id=version_id,
+            quantity=int(10_000 / (version_id + 1)) + random_generator.randint(0, 500),
+        )
+        for version_id in range(number_of_versions)
+    ]
+
+
+@pytest.mark.parametrize("subproblem_cache_size", [1, 5, 100])
+def test_bounded_subproblem_cache_gives_the_same_solutions(subproblem_cache_size):
+    versions = generate_versions(random.Random(0), 40)
+    co_mail_facility = generate_co_mail_facility(versions, 5)
+    expected = SplitVersionsGenerator(
+        co_mail_facility, versions, subproblem_cache_size=0
+    ).generate(None)
+
+    generator = SplitVersionsGenerator(
+        co_mail_facility, versions, subproblem_cache_size=subproblem_cache_size
+    )
+
+    assert generator.generate(None) == expected
+    assert generator.subproblem_cache.size <= subproblem_cache_size
+    assert all(
+        len(tails) <= generator.subproblem_cache.max_entry_size
+        for tails in generator.subproblem_cache.entries.values()
+    )
+
+
+def generate_sorted_version_values(random_generator):
+    """
+    Sorted random version quantities with repeated values and limit_max from below the
+     smallest to above the biggest possible sum.
+    """
+    number_of_versions = random_generator.randint(1, 12)
+    version_to_quantity_mapping = {
+        f"V{version_id}": random_generator.choice(
+            [random_generator.randint(1, 20), random_generator.randint(1, 1_000)]
+        )
+        for version_id in range(number_of_versions)
+    }
+    versions = sorted(
+        version_to_quantity_mapping, key=version_to_quantity_mapping.__getitem__
+    )
+    version_values = [version_to_quantity_mapping[version] for version in versions]
+    pockets = random_generator.randint(0, number_of_versions)
+    limit_max = random_generator.randint(0, sum(version_values) + 10)
+    return version_to_quantity_mapping, versions, version_values, pockets, limit_max
+
+
+@pytest.fixture(scope="module")
+def generator():
+    versions = generate_versions(random.Random(0), 10)
+    return SplitVersionsGenerator(generate_co_mail_facility(versions, 2), versions)
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_average_matches_sliding_window(generator, seed):
+    version_to_quantity_mapping, versions, version_values, pockets, limit_max = (
+        generate_sorted_version_values(random.Random(seed))
+    )
+    arguments = (
+        version_to_quantity_mapping,
+        versions,
+        version_values,
+        pockets,
+        0,
+        limit_max,
+    )
+
+    assert generator.get_versions_to_split_average(
+        *arguments
+    ) == generator.get_versions_to_split_average_sliding_window(*arguments)
+
+
+def get_closest_subset_sum(version_values, pockets, limit_max):
+    # Bit s of subset_sums[picks] is set if picks of the versions sum to s
+    subset_sums = [1] + [0] * pockets
+    for value in version_values:
+        for picks in range(pockets - 1, -1, -1):
+            subset_sums[picks + 1] |= subset_sums[picks] << value
+    if subset_sums[pockets] >> limit_max:
+        completed_sums = subset_sums[pockets] >> limit_max
+        return limit_max + (completed_sums & -completed_sums).bit_length() - 1
+    return subset_sums[pockets].bit_length() - 1
+
+
+def generate_closest_subset_case(random_generator, max_value, multiple=1):
+    number_of_versions = random_generator.randint(1, 60)
+    version_values = sorted(
+        random_generator.randint(1, random_generator.choice([10, max_value]))
+        * multiple
+        for _ in range(number_of_versions)
+    )
+    pockets = random_generator.randint(1, number_of_versions)
+    limit_max = random_generator.randint(0, sum(version_values))
+    return version_values, pockets, limit_max
+
+
+def get_closest_subset(generator, version_values, pockets, limit_max):
+    versions = [f"V{version_id}" for version_id in range(len(version_values))]
+    number_of_pieces_used, version_values_tuple = (
+        generator.get_versions_to_split_closest_subset(
+            dict(zip(versions, version_values)),
+            versions,
+            version_values,
+            pockets,
+            0,
+            limit_max,
+        )
+    )
+    assert len({version for version, _ in version_values_tuple}) == pockets
+    return number_of_pieces_used
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_closest_subset_is_exact(generator, seed):
+    # Sums stay below SUBSET_SEARCH_MAX_SUM
+    version_values, pockets, limit_max = generate_closest_subset_case(
+        random.Random(seed), 4_000
+    )
+
+    assert get_closest_subset(
+        generator, version_values, pockets, limit_max
+    ) == get_closest_subset_sum(version_values, pockets, limit_max)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_closest_subset_is_exact_for_quantities_with_a_common_divisor(
+    generator, seed
+):
+    version_values, pockets, limit_max = generate_closest_subset_case(
+        random.Random(seed), 4_000, multiple=1_000
+    )
+
+    assert get_closest_subset(
+        generator, version_values, pockets, limit_max
+    ) == 1_000 * get_closest_subset_sum(
+        [value // 1_000 for value in version_values], pockets, -(-limit_max // 1_000)
+    )
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_closest_subset_above_max_sum_reaches_limit_max(generator, monkeypatch, seed):
+    monkeypatch.setattr(generator, "SUBSET_SEARCH_MAX_SUM", 1_000)
+    version_values, pockets, limit_max = generate_closest_subset_case(
+        random.Random(seed), 4_000
+    )
+    closest_subset_sum = get_closest_subset_sum(version_values, pockets, limit_max)
+    # Rounding error of the quantities of all picked versions
+    error = pockets * max(-(-limit_max // 1_000), 1)
+    closest_subset_sum_with_error = get_closest_subset_sum(
+        version_values, pockets, limit_max + error
+    )
+
+    number_of_pieces_used = get_closest_subset(
+        generator, version_values, pockets, limit_max
+    )
+
+    if closest_subset_sum < limit_max:
+        assert number_of_pieces_used == closest_subset_sum
+    else:
+        assert number_of_pieces_used >= limit_max
+    if closest_subset_sum_with_error >= limit_max + error:
+        assert number_of_pieces_used <= closest_subset_sum_with_error + error
+
+
+def test_grouped_last_line_config_takes_more_versions_than_pockets():
+    line_configuration = LineConfiguration(
+        pk=1, pockets=2, min_quantity_per_line=10, max_quantity_all_lines=1_000
+    )
+    co_mail_facility = CoMailFacility(
+        line_configs=[line_configuration],
+        lines=[Line(line_configuration=line_configuration) for _ in range(2)],
+    )
+    versions = [
+        Version(version_id=version_id, quantity=quantity)
+        for version_id, quantity in enumerate([100, 90, 80])
+    ]
+
+    solutions = SplitVersionsGenerator(co_mail_facility, versions).generate(None)
+
+    assert solutions
+    for solution in solutions:
+        (lines,) = solution.line_versions_tuple_list
+        assert len(lines) == 2
+        assert sorted(version for line in lines for version, _ in line) == [0, 1, 2]
+
+
+def get_canonical_solutions(solutions):
+    return [
+        CompactSolution.from_solution(solution).canonical() for solution in solutions
+    ]
+
+
+def test_duplicate_solutions_are_dropped_before_scoring():
+    versions = generate_versions(random.Random(0), 40)
+    co_mail_facility = generate_co_mail_facility(versions, 5)
+    generator = SplitVersionsGenerator(co_mail_facility, versions)
+    scored_solutions = []
+
+    def score_function(solution):
+        scored_solutions.append(solution)
+        return 0
+
+    solutions = generator.generate(5, score_function=score_function)
+
+    assert generator.number_of_duplicate_solutions > 0
+    canonical_solutions = get_canonical_solutions(scored_solutions)
+    assert len(set(canonical_solutions)) == len(canonical_solutions)
+    assert len(solutions) == 5
+
+
+def test_seen_solutions_keeps_only_the_most_recent_solutions():
+    versions = generate_versions(random.Random(0), 40)
+    solutions = SplitVersionsGenerator(
+        generate_co_mail_facility(versions, 5), versions
+    ).generate(None)
+    seen_solutions = SeenSolutions(3)
+
+    assert len(solutions) > 3
+    assert all(seen_solutions.add(solution) for solution in solutions)
+    assert len(seen_solutions.digests) == 3
+    assert not seen_solutions.add(solutions[-1])
+    assert seen_solutions.add(solutions[0])
+
+
+def test_parallel_search_drops_the_same_duplicates():
+    versions = generate_versions(random.Random(0), 40)
+    co_mail_facility = generate_co_mail_facility(versions, 5)
+    generator = SplitVersionsGenerator(co_mail_facility, versions)
+    expected = generator.generate(None)
+    number_of_duplicate_solutions = generator.number_of_duplicate_solutions
+
+    assert generator.generate(None, max_workers=2) == expected
+    assert generator.number_of_duplicate_solutions == number_of_duplicate_solutions
+
+
+@pytest.fixture(scope="module", params=range(3))
+def screening_case(request, tmp_path_factory):
+    seed = request.param
+    file_path = str(tmp_path_factory.mktemp("screening") / "input.csv")
+    generate_input_file(
+        file_path,
+        30_000,
+        seed=seed,
+        number_of_versions=40 + 10 * seed,
+        version_size_exponent=0.5 + 0.25 * seed,
+    )
+    versions, address_mapping = get_versions([file_path], compact=True)
+    generator = SplitVersionsGenerator(
+        generate_co_mail_facility(versions, 6), versions
+    )
+    solutions = generator.generate(150)
+    expected = SolutionChecker(
+        solutions,
+        address_mapping,
+        generator.line_configs,
+        use_package_count_engine=True,
+    ).calculate_solutions()
+    return solutions, address_mapping, generator.line_configs, expected
+
+
+@pytest.mark.parametrize("sample_fraction", [0.05, 0.1, 0.25])
+def test_screened_best_matches_exhaustive_best(screening_case, sample_fraction):
+    solutions, address_mapping, line_configs, expected = screening_case
+    solution_checker = SolutionChecker(
+        solutions,
+        address_mapping,
+        line_configs,
+        use_package_count_engine=True,
+        sample_fraction=sample_fraction,
+    )
+
+    assert solution_checker.calculate_solutions() == expected
+    assert len(solution_checker.package_count_estimates) == len(solutions)
+
+
+def test_screening_scores_fewer_solutions(screening_case):
+    solutions, address_mapping, line_configs, expected = screening_case
+    solution_checker = SolutionChecker(
+        solutions,
+        address_mapping,
+        line_configs,
+        use_package_count_engine=True,
+        sample_fraction=0.25,
+    )
+    scored_solutions = []
+    calculate_number_of_packages = solution_checker.calculate_number_of_packages
+
+    def score_function(all_lines_result_tuples):
+        scored_solutions.append(all_lines_result_tuples)
+        return calculate_number_of_packages(all_lines_result_tuples)
+
+    solution_checker.calculate_number_of_packages = score_function
+
+    assert solution_checker.calculate_solutions() == expected
+    assert solution_checker.number_of_screened_out_solutions > 0
+    # The solution with the best estimate is scored once, when screening
+    assert len(scored_solutions) == (
+        len(solutions) - solution_checker.number_of_screened_out_solutions
+    )
+
+
+def test_generate_best_prunes_and_matches_exhaustive_scoring(tmp_path):
+    file_path = str(tmp_path / "input.csv")
+    generate_input_file(file_path, 5_000, seed=3, number_of_versions=40)
+    versions, address_mapping = get_versions([file_path], compact=True)
+    co_mail_facility = generate_co_mail_facility(versions, 6)
+    package_count_engine = PackageCountEngine(address_mapping)
+    solutions = SplitVersionsGenerator(co_mail_facility, versions).generate(None)
+    numbers_of_packages = [
+        package_count_engine.calculate_number_of_packages(
+            solution.line_versions_tuple_list
+        )
+        for solution in solutions
+    ]
+    best_number_of_packages = max(numbers_of_packages)
+    generator = SplitVersionsGenerator(co_mail_facility, versions)
+
+    assert generator.generate_best(package_count_engine) == (
+        best_number_of_packages,
+        solutions[numbers_of_packages.index(best_number_of_packages)],
+    )
+    assert generator.number_of_pruned_branches > 0